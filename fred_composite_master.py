@@ -1,10 +1,14 @@
 import json
 import os
+import sys
 from collections import defaultdict
 
+from fred_records import SeriesRecordTable, StringPool, write_tables_json
+
 # --- Configuration ---
 
-OUTPUT_DIR = 'fred_county_series_output'
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BASE_DIR, 'fred_county_series_output')
 MASTER_FILENAME = 'fred_master_counties.json'
 
 # Standard USPS abbreviations for the 50 US states and the District of Columbia
@@ -18,19 +22,25 @@ US_STATES = {
     'DC' 
 }
 
-def consolidate_and_archive_fred_data(output_dir: str, master_filename: str):
+def consolidate_and_archive_fred_data(output_dir: str, master_filename: str, delete_originals: bool = True):
     """
     Reads all state JSON files, filters for the 50 US states PLUS D.C.,
     composites them into one master JSON, and deletes the originals.
+    Pass delete_originals=False to keep the state files (the pipeline
+    does this because fred_consolidate.py also reads them).
+    Raises RuntimeError if there is nothing to consolidate or the master
+    file cannot be written.
     """
     
     if not os.path.isdir(output_dir):
-        print(f"Error: Directory '{output_dir}' not found. Please run the county script first.")
-        return
+        raise RuntimeError(f"Error: Directory '{output_dir}' not found. Please run the county script first.")
 
     # Dictionary to hold the master aggregated data
     # Structure: master_data[State_Abbreviation] = {Series_Title: [County_Records...]}
+    # Each state is held as a compact SeriesRecordTable; one pool is shared so
+    # units and title families repeated across states are stored once.
     master_data = {}
+    pool = StringPool()
     files_to_delete = []
     
     print(f"Starting consolidation from directory: {output_dir}")
@@ -52,12 +62,13 @@ def consolidate_and_archive_fred_data(output_dir: str, master_filename: str):
                     state_data = json.load(f)
                 
                 # Add the state's data to the master dictionary
-                master_data[state_abbr] = state_data
+                master_data[state_abbr] = SeriesRecordTable.from_grouped(state_data, pool)
+                del state_data
                 
                 # Queue the file for deletion upon successful read
                 files_to_delete.append(filepath)
                 
-                print(f"  ✓ Included {state_abbr} ({len(state_data)} unique series titles)")
+                print(f"  ✓ Included {state_abbr} ({len(master_data[state_abbr])} unique series titles)")
                 
             except json.JSONDecodeError:
                 print(f"  ! Skipped {filename}: Error decoding JSON.")
@@ -67,21 +78,24 @@ def consolidate_and_archive_fred_data(output_dir: str, master_filename: str):
             print(f"  - Skipped {state_abbr}: Not one of the 50 US states or D.C.")
 
     if not master_data:
-        print("\nNo state or D.C. data found. Nothing to consolidate.")
-        return
+        raise RuntimeError("No state or D.C. data found. Nothing to consolidate.")
 
     # 2. Write Master JSON File
     master_filepath = os.path.join(output_dir, master_filename)
     try:
         with open(master_filepath, 'w', encoding='utf-8') as f:
             # Sort the master keys (state abbreviations) alphabetically for cleaner archiving
-            json.dump(master_data, f, indent=4, sort_keys=True)
+            write_tables_json(master_data, f, indent=4, sort_keys=True)
         
         print(f"\nSuccessfully created master file: **{master_filepath}**")
         print(f"Contains data for {len(master_data)} states/districts.")
         
     except IOError as e:
-        print(f"FATAL ERROR: Could not write master file {master_filepath}. Aborting file deletion. Error: {e}")
+        raise RuntimeError(f"FATAL ERROR: Could not write master file {master_filepath}. "
+                           f"Aborting file deletion. Error: {e}")
+
+    if not delete_originals:
+        print("\nKeeping individual state files.")
         return
 
     # 3. Delete Individual State Files
@@ -99,4 +113,8 @@ def consolidate_and_archive_fred_data(output_dir: str, master_filename: str):
 
 # --- Execution ---
 if __name__ == "__main__":
-    consolidate_and_archive_fred_data(OUTPUT_DIR, MASTER_FILENAME)
\ No newline at end of file
+    try:
+        consolidate_and_archive_fred_data(OUTPUT_DIR, MASTER_FILENAME)
+    except RuntimeError as e:
+        print(f"{e}")
+        sys.exit(1)
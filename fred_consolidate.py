@@ -1,6 +1,14 @@
 import json
 import glob
 import os
+import sys
+
+from fred_records import SeriesRecordTable
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_DIRECTORY = os.path.join(BASE_DIR, "fred_county_series_output")
+OUTPUT_FILENAME = "fred_by_series_title.json"
 
 def extract_series_prefix(full_title):
     """
@@ -22,26 +30,27 @@ def extract_series_prefix(full_title):
         return full_title.strip()
 
 def combine_state_data_by_series_title(
-    input_directory="/Users/home/Desktop/US-County_analyses/fred_county_series_output",
-    output_filename="fred_by_series_title.json"
+    input_directory=INPUT_DIRECTORY,
+    output_filename=OUTPUT_FILENAME
 ):
     """
     Reads all JSON files matching the pattern '*_fred_series.json' in the
     specified directory, combines their data, and organizes the results
     by the series title prefix (e.g., 'Unemployment Rate') into a single
-    output JSON file.
+    output JSON file. Raises RuntimeError if there are no input files or
+    the output cannot be written.
     """
     # Use glob to find all files matching the pattern
     file_pattern = os.path.join(input_directory, "*_fred_series.json")
     all_files = glob.glob(file_pattern)
 
     if not all_files:
-        print(f"⚠️ No files found matching '{file_pattern}'. Please check the directory path.")
-        return
+        raise RuntimeError(f"⚠️ No files found matching '{file_pattern}'. Please check the directory path.")
 
-    # Dictionary to hold the final combined data, keyed by the series title prefix
+    # Table to hold the final combined data, keyed by the series title prefix
     # e.g., {"Unemployment Rate": [series_for_county_A, series_for_county_B, ...]}
-    combined_data = {}
+    # Records are stored column-wise with interned strings (see fred_records.py)
+    combined_data = SeriesRecordTable()
 
     print(f"🔍 Found {len(all_files)} files in '{input_directory}'. Starting to process...")
 
@@ -64,10 +73,7 @@ def combine_state_data_by_series_title(
                             series_prefix = extract_series_prefix(full_title)
 
                             # Append the entire series object to the list for this series prefix
-                            if series_prefix not in combined_data:
-                                combined_data[series_prefix] = []
-
-                            combined_data[series_prefix].append(series)
+                            combined_data.append_record(series_prefix, series)
                         else:
                             print(f"Skipping a series in {filename} due to missing 'Full_Series_Title' field.")
 
@@ -82,14 +88,19 @@ def combine_state_data_by_series_title(
         output_path = os.path.join(os.path.dirname(input_directory), output_filename)
 
         with open(output_path, 'w') as outfile:
-            json.dump(combined_data, outfile, indent=4)
+            combined_data.write_json(outfile, indent=4)
 
         print(f"✅ Successfully combined data from {len(all_files)} files.")
         print(f"The final data is grouped under {len(combined_data)} unique series titles.")
         print(f"Output saved to: {output_path}")
 
     except Exception as e:
-        print(f"🚫 Error writing to output file {output_filename}: {e}")
+        raise RuntimeError(f"🚫 Error writing to output file {output_filename}: {e}") from e
 
 # --- Execute the function ---
-combine_state_data_by_series_title()
\ No newline at end of file
+if __name__ == "__main__":
+    try:
+        combine_state_data_by_series_title()
+    except RuntimeError as e:
+        print(f"{e}")
+        sys.exit(1)
@@ -0,0 +1,438 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+from fred_cube import CUBES_DIR, FIPS_MAP_FILE, county_axis, open_cube
+from fred_rollup import WEIGHT_FAMILIES, _aligned_weights
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SUBS_DIR = os.path.join(BASE_DIR, 'subs')
+GEOJSON_CACHE_FILE = os.path.join(BASE_DIR, 'fred_maps', 'geojson-counties-fips.json')
+# County-level 2024 presidential results (subs/2024_pres.py), keyed by
+# county_fips in census2022 codes (Connecticut planning regions)
+ELECTION_FILE = os.path.join(SUBS_DIR, '2024_pres_results.json')
+ELECTION_VINTAGE = 'census2022'
+
+# The county list in subs/fred_fips_map.json (and so every cube) follows the
+# 2010 Census national_county.txt pulled by subs/county_fips.py.
+BASE_VINTAGE = 'census2010'
+
+# BEA combined areas: code -> (name as listed by FRED, census2010 components)
+BEA_AREAS = {
+    '15901': ('Maui + Kalawao Counties, HI', ['15009', '15005']),
+    '51901': ('Albemarle County + Charlottesville City, VA', ['51003', '51540']),
+    '51903': ('Alleghany County + Covington City, VA', ['51005', '51580']),
+    '51907': ('Augusta, Staunton + Waynesboro County, VA', ['51015', '51790', '51820']),
+    '51911': ('Campbell County + Lynchburg City, VA', ['51031', '51680']),
+    '51913': ('Carroll County + Galax City, VA', ['51035', '51640']),
+    '51918': ('Dinwiddie, Colonial Heights + Petersburg County, VA', ['51053', '51570', '51730']),
+    '51919': ('Fairfax, Fairfax City + Falls Church County, VA', ['51059', '51600', '51610']),
+    '51921': ('Frederick County + Winchester City, VA', ['51069', '51840']),
+    '51923': ('Greensville County + Emporia City, VA', ['51081', '51595']),
+    '51929': ('Henry County + Martinsville City, VA', ['51089', '51690']),
+    '51931': ('James City County + Williamsburg City, VA', ['51095', '51830']),
+    '51933': ('Montgomery County + Radford City, VA', ['51121', '51750']),
+    '51939': ('Pittsylvania County + Danville City, VA', ['51143', '51590']),
+    '51941': ('Prince George County + Hopewell City, VA', ['51149', '51670']),
+    '51942': ('Prince William, Manassas + Manassas Park County, VA', ['51153', '51683', '51685']),
+    '51944': ('Roanoke County + Salem City, VA', ['51161', '51775']),
+    '51945': ('Rockbridge, Buena Vista + Lexington County, VA', ['51163', '51530', '51678']),
+    '51947': ('Rockingham County + Harrisonburg City, VA', ['51165', '51660']),
+    '51949': ('Southampton County + Franklin City, VA', ['51175', '51620']),
+    '51951': ('Spotsylvania County + Fredericksburg City, VA', ['51177', '51630']),
+    '51953': ('Washington County + Bristol City, VA', ['51191', '51520']),
+    '51955': ('Wise County + Norton City, VA', ['51195', '51720']),
+    '51958': ('York County + Poquoson City, VA', ['51199', '51735']),
+    '55901': ('Shawano County, WI (includes Menominee)', ['55115', '55078']),
+}
+
+# Every other vintage is defined by how census2010 counties map into it:
+# (census2010 FIPS, FIPS in the vintage, share of the census2010 county's
+# population). A county that is not listed keeps its code.
+VINTAGE_CHANGES = {
+    # Codes in use since Connecticut switched to planning regions (2022),
+    # e.g. in the 2024 election results
+    'census2022': [
+        ('46113', '46102', 1.0),  # Shannon County, SD renamed Oglala Lakota County (2015)
+        ('02270', '02158', 1.0),  # Wade Hampton Census Area, AK renamed Kusilvak (2015)
+        ('51515', '51019', 1.0),  # Bedford city, VA merged into Bedford County (2013)
+        # Valdez-Cordova Census Area, AK split in 2019 (shares from 2020 Census populations)
+        ('02261', '02063', 0.7307),  # Chugach Census Area
+        ('02261', '02066', 0.2693),  # Copper River Census Area
+        # Connecticut's 8 counties replaced by 9 planning regions (2022).
+        # Shares of each county's 2020 Census population by the towns that
+        # make up each region.
+        ('09001', '09120', 0.3403),  # Fairfield -> Greater Bridgeport
+        ('09001', '09140', 0.0427),  # Fairfield -> Naugatuck Valley (Shelton)
+        ('09001', '09190', 0.6170),  # Fairfield -> Western Connecticut
+        ('09003', '09110', 0.9195),  # Hartford -> Capitol
+        ('09003', '09140', 0.0676),  # Hartford -> Naugatuck Valley (Bristol)
+        ('09003', '09160', 0.0129),  # Hartford -> Northwest Hills (Burlington, Hartland)
+        ('09005', '09140', 0.2933),  # Litchfield -> Naugatuck Valley
+        ('09005', '09160', 0.5459),  # Litchfield -> Northwest Hills
+        ('09005', '09190', 0.1608),  # Litchfield -> Western Connecticut (Bridgewater, New Milford)
+        ('09007', '09130', 1.0),     # Middlesex -> Lower Connecticut River Valley
+        ('09009', '09140', 0.3404),  # New Haven -> Naugatuck Valley
+        ('09009', '09170', 0.6596),  # New Haven -> South Central Connecticut
+        ('09011', '09130', 0.0372),  # New London -> Lower Connecticut River Valley (Lyme, Old Lyme)
+        ('09011', '09150', 0.0096),  # New London -> Northeastern Connecticut (Voluntown)
+        ('09011', '09180', 0.9532),  # New London -> Southeastern Connecticut
+        ('09013', '09110', 0.9948),  # Tolland -> Capitol
+        ('09013', '09150', 0.0052),  # Tolland -> Northeastern Connecticut (Union)
+        ('09015', '09150', 0.7905),  # Windham -> Northeastern Connecticut
+        ('09015', '09180', 0.2095),  # Windham -> Southeastern Connecticut (Windham town)
+    ],
+    # BEA / FRED combined areas: Virginia independent cities folded into
+    # their surrounding county, plus two small counties
+    'bea': [(component, code, 1.0)
+            for code, (_, components) in sorted(BEA_AREAS.items())
+            for component in components],
+}
+
+# Optional relationship files with more census2010 -> vintage rows; a row
+# replaces the bundled edge with the same source and target (e.g. to give
+# the Connecticut edges land-area shares). CSV columns: source_fips,
+# target_fips, population_share and optionally area_share (share of the
+# census2010 county's population/land area that lies in the target).
+# Missing files are skipped.
+RELATIONSHIP_FILES = {
+    'census2022': [os.path.join(SUBS_DIR, 'ct_planning_regions.csv')],
+}
+
+# census2010 codes that no longer exist in a vintage and have no successor
+# (their values are dropped, with a warning)
+RETIRED = {}
+
+HOW = ('mean', 'sum')
+WEIGHTS = tuple(WEIGHT_FAMILIES) + ('area', 'equal')
+
+# Crosswalks already built in this process: (vintage, fips_map_file) -> Crosswalk
+_crosswalks = {}
+
+
+def bea_area_fips(county_name):
+    """BEA code of a FRED combined-area county name (used by subs/fred_mapping.py), or None."""
+    for code, (name, _) in BEA_AREAS.items():
+        if name == county_name:
+            return code
+    return None
+
+def load_relationship_file(path):
+    """Reads a relationship CSV into [(source, target, population_share, area_share or None)]."""
+    rows = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for record in csv.DictReader(f):
+            area_share = record.get('area_share')
+            rows.append((
+                str(record['source_fips']).zfill(5),
+                str(record['target_fips']).zfill(5),
+                float(record['population_share']),
+                float(area_share) if area_share not in (None, '') else None,
+            ))
+    return rows
+
+
+class Crosswalk:
+    """
+    The relationship between the census2010 county axis and one other
+    vintage, as a sparse (COO) list of edges: edge e carries
+    population_share[e] (or area_share[e]) of census2010 row base_rows[e]
+    into vintage row rows[e].
+
+    remap() applies it in either direction to a whole (counties x periods)
+    array at once with a few reduceat passes over the edges.
+    """
+
+    def __init__(self, vintage, base_fips, fips, base_rows, rows, population_share, area_share):
+        self.vintage = vintage
+        self.base_fips = list(base_fips)
+        self.fips = list(fips)
+        self.base_rows = base_rows
+        self.rows = rows
+        self.population_share = population_share
+        self.area_share = area_share
+
+    @classmethod
+    def build(cls, vintage, fips_map_file=FIPS_MAP_FILE):
+        if vintage not in VINTAGE_CHANGES:
+            raise ValueError(f"Unknown vintage '{vintage}'. Choose from {', '.join(vintages())}")
+        base_fips, _ = county_axis(fips_map_file)
+        base_row = {code: i for i, code in enumerate(base_fips)}
+
+        edges = {(source, target): (source, target, share, None)
+                 for source, target, share in VINTAGE_CHANGES[vintage]}
+        for path in RELATIONSHIP_FILES.get(vintage, []):
+            if os.path.exists(path):
+                edges.update(((edge[0], edge[1]), edge) for edge in load_relationship_file(path))
+        edges = [edge for edge in edges.values() if edge[0] in base_row]
+
+        changed = {edge[0] for edge in edges} | set(RETIRED.get(vintage, []))
+        edges.extend((code, code, 1.0, None) for code in base_fips if code not in changed)
+        fips = sorted({edge[1] for edge in edges})
+        row = {code: i for i, code in enumerate(fips)}
+
+        population_share = np.array([edge[2] for edge in edges])
+        # Bundled full-county moves and renames hold for area too; otherwise
+        # an edge without an area share is split like its population
+        area_share = np.array([edge[3] if edge[3] is not None else edge[2] for edge in edges])
+        return cls(vintage, base_fips, fips,
+                   np.array([base_row[edge[0]] for edge in edges], dtype=np.int64),
+                   np.array([row[edge[1]] for edge in edges], dtype=np.int64),
+                   population_share, area_share)
+
+    def unmapped(self):
+        """census2010 codes with no edge into this vintage (their values are dropped)."""
+        mapped = set(self.base_rows.tolist())
+        return [code for i, code in enumerate(self.base_fips) if i not in mapped]
+
+    def remap(self, values, how='mean', weights=None, reverse=False, area=False):
+        """
+        Moves values (census2010 rows x periods, or a 1-D vector) into this
+        vintage, or back from it with reverse=True.
+
+        how='sum' treats values as counts (population, labor force): a county
+        split between two targets gives each its share, merged counties add
+        up. how='mean' treats them as rates or averages: each target is the
+        average of its sources weighted by the overlapping weight.
+
+        weights are census2010 county weights (population, labor force or
+        land area; same shape as values or one per row). They set the
+        overlap of each edge, so they are needed for means over merged
+        counties and for sums going in reverse; without them every county
+        counts the same. Where a weight is missing (NaN) or the weights of
+        a group sum to zero, that group falls back to the plain shares;
+        counties that map one-to-one ignore weights. Missing values (NaN)
+        are skipped in means and make a sum missing.
+        """
+        if how not in HOW:
+            raise ValueError(f"Unknown remap '{how}'. Choose from {', '.join(HOW)}")
+        values = np.asarray(values, dtype=np.float64)
+        vector = values.ndim == 1
+        if vector:
+            values = values[:, None]
+
+        if reverse:
+            sources, targets, n_targets = self.rows, self.base_rows, len(self.base_fips)
+        else:
+            sources, targets, n_targets = self.base_rows, self.rows, len(self.fips)
+
+        share = (self.area_share if area else self.population_share)[:, None]
+        if weights is None:
+            overlap = np.broadcast_to(share, (len(share), values.shape[1]))
+        else:
+            # An edge's weight only matters against the other edges of its
+            # group: the sources of a target for a mean, the parts of a
+            # vintage county for a reverse sum
+            group, n_groups = (self.rows, len(self.fips)) if how == 'sum' and reverse else (targets, n_targets)
+            weights = np.asarray(weights, dtype=np.float64)
+            weights = weights[:, None] if weights.ndim == 1 else weights
+            edge_weights = weights[self.base_rows]
+            weighted = share * np.nan_to_num(edge_weights)
+            fallback = ((_sum_by(group, np.isnan(edge_weights), n_groups) > 0)
+                        | (_sum_by(group, weighted, n_groups) <= 0)
+                        | (np.bincount(group, minlength=n_groups) <= 1)[:, None])
+            overlap = np.where(fallback[group], share, weighted)
+        source_values = values[sources]
+        missing = np.isnan(source_values)
+
+        if how == 'sum':
+            if reverse:
+                # Split each vintage county over its census2010 parts by overlap
+                totals = _sum_by(self.rows, overlap, len(self.fips))[self.rows]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    fraction = np.where(totals > 0, overlap / totals, 0.0)
+            else:
+                fraction = share
+            result = _sum_by(targets, np.where(missing, 0.0, source_values * fraction), n_targets)
+            result[_sum_by(targets, missing, n_targets) > 0] = np.nan
+        else:
+            weight = np.where(missing, 0.0, overlap)
+            numerator = _sum_by(targets, np.where(missing, 0.0, source_values) * weight, n_targets)
+            denominator = _sum_by(targets, weight, n_targets)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = np.where(denominator > 0, numerator / denominator, np.nan)
+
+        # Targets without any edge stay missing
+        result[np.bincount(targets, minlength=n_targets) == 0] = np.nan
+        return result[:, 0] if vector else result
+
+
+def _sum_by(keys, values, n_keys):
+    """Sums the rows of `values` by integer key into n_keys rows (one reduceat over sorted keys)."""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.zeros((n_keys,) + values.shape[1:])
+    if not len(keys):
+        return out
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    out[sorted_keys[starts]] = np.add.reduceat(values[order], starts, axis=0)
+    return out
+
+
+def vintages():
+    return [BASE_VINTAGE] + sorted(VINTAGE_CHANGES)
+
+def crosswalk(vintage, fips_map_file=FIPS_MAP_FILE):
+    """The Crosswalk from census2010 to `vintage`, built once per process."""
+    key = (vintage, fips_map_file)
+    if key not in _crosswalks:
+        _crosswalks[key] = Crosswalk.build(vintage, fips_map_file)
+    return _crosswalks[key]
+
+def county_fips(vintage, fips_map_file=FIPS_MAP_FILE):
+    """Sorted county FIPS codes of a vintage."""
+    if vintage == BASE_VINTAGE:
+        return county_axis(fips_map_file)[0]
+    return crosswalk(vintage, fips_map_file).fips
+
+def county_areas(fips, geojson_file=GEOJSON_CACHE_FILE):
+    """Land area (sq mi, CENSUSAREA of the 2010 county GeoJSON used by fred_vis) per FIPS; NaN if unknown."""
+    import fred_vis
+
+    os.makedirs(os.path.dirname(geojson_file), exist_ok=True)
+    counties = fred_vis.load_county_geojson(geojson_file)
+    area = {feature['id']: feature['properties'].get('CENSUSAREA') for feature in counties['features']}
+    return np.array([area.get(code) or np.nan for code in fips], dtype=np.float64)
+
+def remap(values, from_vintage, to_vintage, how='mean', weights=None, area=False, fips_map_file=FIPS_MAP_FILE):
+    """
+    Remaps a (counties x periods) array or a vector whose rows follow
+    county_fips(from_vintage) onto county_fips(to_vintage). Conversions
+    between two non-census2010 vintages go through census2010. weights are
+    on the census2010 axis (see Crosswalk.remap).
+    """
+    if from_vintage == to_vintage:
+        return np.asarray(values, dtype=np.float64)
+    if from_vintage != BASE_VINTAGE:
+        values = crosswalk(from_vintage, fips_map_file).remap(values, how, weights, reverse=True, area=area)
+    if to_vintage != BASE_VINTAGE:
+        values = crosswalk(to_vintage, fips_map_file).remap(values, how, weights, area=area)
+    return values
+
+def remap_values(values_by_fips, from_vintage, to_vintage, how='mean', weights=None, area=False,
+                 fips_map_file=FIPS_MAP_FILE):
+    """
+    remap() for a {FIPS: value} mapping (e.g. one date of a series, or an
+    election result column). Codes missing from the source vintage are
+    ignored; returns {FIPS: value} for every target county with a value.
+    """
+    source = county_fips(from_vintage, fips_map_file)
+    vector = np.array([values_by_fips.get(code, np.nan) for code in source], dtype=np.float64)
+    result = remap(vector, from_vintage, to_vintage, how, weights, area, fips_map_file)
+    return {code: float(value) for code, value in zip(county_fips(to_vintage, fips_map_file), result)
+            if not np.isnan(value)}
+
+def family_weights(cube, weight, cubes_dir=CUBES_DIR):
+    """
+    census2010 weights for remapping a cube: per county and period from a
+    WEIGHT_FAMILIES cube, per county for 'area', None for 'equal'.
+    """
+    if weight not in WEIGHTS:
+        raise ValueError(f"Unknown weight '{weight}'. Choose from {', '.join(WEIGHTS)}")
+    if weight in WEIGHT_FAMILIES:
+        weights_values, weights_mask = _aligned_weights(cube, open_cube(WEIGHT_FAMILIES[weight], cubes_dir))
+        return np.where(weights_mask, weights_values, np.nan)
+    if weight == 'area':
+        return county_areas(cube.fips)
+    return None
+
+def remap_family(family, to_vintage, how='mean', weight='population', cubes_dir=CUBES_DIR,
+                 fips_map_file=FIPS_MAP_FILE):
+    """
+    Remaps a whole series family cube (every county and period in one pass)
+    onto `to_vintage`. weight is a WEIGHT_FAMILIES name whose cube supplies
+    per-period weights, 'area' for land area, or 'equal'.
+    Returns (fips, values, cube).
+    """
+    cube = open_cube(family, cubes_dir)
+    weights = family_weights(cube, weight, cubes_dir)
+    values = np.where(cube.mask, cube.values, np.nan)
+    result = remap(values, BASE_VINTAGE, to_vintage, how, weights, area=weight == 'area',
+                   fips_map_file=fips_map_file)
+    return county_fips(to_vintage, fips_map_file), result, cube
+
+def join_election_results(family, how='mean', weight='population', election_file=ELECTION_FILE,
+                          cubes_dir=CUBES_DIR, fips_map_file=FIPS_MAP_FILE):
+    """
+    Joins the latest period of a family cube onto the 2024 presidential
+    results. The cube is on census2010 counties and the results on
+    census2022 ones, so the values go through remap_values() first and
+    Connecticut's planning regions get a value too.
+    Returns (period, rows): each election record with the family's value
+    added under the family name (None where the county has no value).
+    """
+    cube = open_cube(family, cubes_dir)
+    has_data = np.flatnonzero(np.asarray(cube.mask).any(axis=0))
+    if not len(has_data):
+        raise ValueError(f"The {family} cube has no data")
+    j = int(has_data[-1])
+
+    values = {code: float(value) for code, value, present in zip(cube.fips, cube.values[:, j], cube.mask[:, j])
+              if present}
+    weights = family_weights(cube, weight, cubes_dir)
+    if weights is not None and weights.ndim == 2:
+        weights = weights[:, j]
+    remapped = remap_values(values, BASE_VINTAGE, ELECTION_VINTAGE, how, weights, area=weight == 'area',
+                            fips_map_file=fips_map_file)
+
+    with open(election_file, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    rows = [dict(record, **{family: remapped.get(str(record['county_fips']).zfill(5))}) for record in results]
+    return cube.periods[j], rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remap county series between FIPS vintages.")
+    parser.add_argument('family', nargs='?', help="series family cube to remap (omit to list the vintages)")
+    parser.add_argument('--to', dest='vintage', default='census2022', choices=vintages())
+    parser.add_argument('--how', default='mean', choices=HOW,
+                        help="mean for rates and averages, sum for counts")
+    parser.add_argument('--weight', default='population', choices=WEIGHTS)
+    parser.add_argument('--output', help="save the latest {FIPS: value} cross-section to this JSON file")
+    parser.add_argument('--election', metavar='OUTPUT',
+                        help="join the family's latest period onto the 2024 presidential results "
+                             f"({ELECTION_VINTAGE} counties) and save the rows to OUTPUT")
+    args = parser.parse_args(argv)
+
+    if args.family and args.election:
+        period, rows = join_election_results(args.family, args.how, args.weight)
+        matched = sum(row[args.family] is not None for row in rows)
+        with open(args.election, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=4)
+        print(f"Joined {args.family} ({period}) onto {matched} of {len(rows)} election counties: {args.election}")
+        return 0
+
+    if not args.family:
+        for vintage in vintages():
+            line = f"{vintage:<12} {len(county_fips(vintage))} counties"
+            if vintage != BASE_VINTAGE:
+                walk = crosswalk(vintage)
+                changed = sorted(set(walk.fips) - set(walk.base_fips))
+                line += f", {len(changed)} codes not in {BASE_VINTAGE}"
+                if walk.unmapped():
+                    line += f", unmapped: {' '.join(walk.unmapped())}"
+            print(line)
+        return 0
+
+    fips, values, cube = remap_family(args.family, args.vintage, args.how, args.weight)
+    unmapped = crosswalk(args.vintage).unmapped() if args.vintage != BASE_VINTAGE else []
+    if unmapped:
+        print(f"  ! No relationship for {', '.join(unmapped)}; see RELATIONSHIP_FILES in fred_crosswalk.py")
+    print(f"{args.family}: {values.shape[0]} {args.vintage} counties x {values.shape[1]} periods")
+
+    if args.output and values.shape[1]:
+        latest = {code: float(value) for code, value in zip(fips, values[:, -1]) if not np.isnan(value)}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'family': args.family, 'vintage': args.vintage, 'date': cube.periods[-1],
+                       'values': latest}, f, indent=4)
+        print(f"Cross-section saved to: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import uuid
+from bisect import bisect_left
+from collections import Counter
+
+import numpy as np
+
+from fred_observations import DEFAULT_FAMILIES, OBSERVATIONS_DIR, load_series_observations, observations_path
+from fred_query import QueryIndex
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CUBES_DIR = os.path.join(BASE_DIR, 'fred_cubes')
+FIPS_MAP_FILE = os.path.join(BASE_DIR, 'subs', 'fred_fips_map.json')
+# County part of a FIPS code from which BEA numbers its combined areas
+BEA_AREA_CODES_FROM = 900
+
+# Frequencies a cube can use, as periods per year
+PERIODS_PER_YEAR = {'A': 1, 'Q': 4, 'M': 12}
+
+# Spare periods allocated past the last observation so new releases can be
+# written into the existing files instead of reallocating them
+CAPACITY_HEADROOM_YEARS = 2
+
+
+# --- Periods ---
+
+def period_index(date_str, frequency):
+    """Maps a 'YYYY-MM-DD' date to an integer period number at `frequency`."""
+    n = PERIODS_PER_YEAR[frequency]
+    return int(date_str[:4]) * n + (int(date_str[5:7]) - 1) * n // 12
+
+def period_indexes(dates, frequency):
+    """Vectorized period_index for a list of 'YYYY-MM-DD' dates."""
+    n = PERIODS_PER_YEAR[frequency]
+    if not len(dates):
+        return np.empty(0, dtype=np.int64)
+    # Months since year 0, parsed by NumPy in one pass
+    months = np.asarray(dates, dtype='datetime64[M]').astype(np.int64) + 1970 * 12
+    return months * n // 12
+
+def period_label(index, frequency):
+    """Returns the 'YYYY-MM-01' start date of a period number."""
+    n = PERIODS_PER_YEAR[frequency]
+    year, k = divmod(int(index), n)
+    return f'{year:04d}-{k * 12 // n + 1:02d}-01'
+
+
+# --- County axis ---
+
+def county_axis(fips_map_file=FIPS_MAP_FILE):
+    """
+    Returns (fips, state_rows): every county FIPS sorted ascending, and
+    {state_abbr: [first_row, end_row]}. Sorting by FIPS keeps each state's
+    counties contiguous, so a state is a plain slice of the cube.
+
+    BEA combined areas (county codes 900 and up, e.g. 51901) are left out:
+    they overlap the counties they combine, so keeping them would count
+    those counties twice in state rollups.
+    """
+    with open(fips_map_file, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+
+    state_of = {}
+    for record in records:
+        code = str(record.get('FIPS') or '').zfill(5)
+        if record.get('FIPS') and int(code[2:]) < BEA_AREA_CODES_FROM:
+            state_of[code] = record.get('State')
+    fips = sorted(state_of)
+
+    state_rows = {}
+    for row, code in enumerate(fips):
+        rows = state_rows.setdefault(state_of[code], [row, row])
+        rows[1] = row + 1
+    return fips, state_rows
+
+def family_slug(family):
+    """Directory name for a series family."""
+    slug = re.sub(r'[^a-z0-9]+', '_', family.lower()).strip('_')[:60]
+    return f"{slug}_{hashlib.sha1(family.encode('utf-8')).hexdigest()[:8]}"
+
+def cube_dir(family, cubes_dir=CUBES_DIR):
+    return os.path.join(cubes_dir, family_slug(family))
+
+
+# --- Reading ---
+
+class SeriesCube:
+    """
+    A series family materialized as a dense county x period float32 array
+    (rows ordered by FIPS) plus a boolean validity mask, both memory-mapped.
+
+    values/mask and everything returned by the accessors are NumPy views of
+    the mapped files; nothing is copied until you do arithmetic on them.
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._values = np.load(os.path.join(path, 'values.npy'), mmap_mode=mode)
+        self._mask = np.load(os.path.join(path, 'mask.npy'), mmap_mode=mode)
+        self.fips = self.meta['fips']
+        self.state_rows = self.meta['state_rows']
+
+    @property
+    def family(self):
+        return self.meta['family']
+
+    @property
+    def frequency(self):
+        return self.meta['frequency']
+
+    @property
+    def start_period(self):
+        return self.meta['start_period']
+
+    @property
+    def n_periods(self):
+        return self.meta['n_periods']
+
+    @property
+    def token(self):
+        """Changes whenever the cube's data changes (used to invalidate caches)."""
+        return self.meta['token']
+
+    @property
+    def values(self):
+        return self._values[:, :self.n_periods]
+
+    @property
+    def mask(self):
+        return self._mask[:, :self.n_periods]
+
+    @property
+    def periods(self):
+        return [period_label(self.start_period + j, self.frequency) for j in range(self.n_periods)]
+
+    def period_position(self, date_str):
+        """Column of the period containing date_str. Raises KeyError if outside the cube."""
+        j = period_index(date_str, self.frequency) - self.start_period
+        if not 0 <= j < self.n_periods:
+            raise KeyError(f"{date_str} is outside {self.family} ({self.periods[0]} .. {self.periods[-1]})")
+        return j
+
+    def row(self, fips):
+        fips = str(fips).zfill(5)
+        i = bisect_left(self.fips, fips)
+        if i == len(self.fips) or self.fips[i] != fips:
+            raise KeyError(f"Unknown FIPS {fips}")
+        return i
+
+    def cross_section(self, date_str):
+        """(values, mask) of every county for one period."""
+        j = self.period_position(date_str)
+        return self.values[:, j], self.mask[:, j]
+
+    def history(self, fips):
+        """(values, mask) of one county across all periods."""
+        i = self.row(fips)
+        return self.values[i], self.mask[i]
+
+    def state_slice(self, state_abbr):
+        first, end = self.state_rows[state_abbr]
+        return slice(first, end)
+
+    def state_view(self, state_abbr):
+        """(values, mask) of one state's counties across all periods."""
+        rows = self.state_slice(state_abbr)
+        return self.values[rows], self.mask[rows]
+
+def open_cube(family, cubes_dir=CUBES_DIR, mode='r'):
+    return SeriesCube(cube_dir(family, cubes_dir), mode=mode)
+
+
+# --- Building ---
+
+def _file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def _allocate(path, name, shape, dtype, fill):
+    """
+    Creates <name>.tmp next to the live file; _commit_allocation() moves it
+    into place, so readers never see a truncated or half-filled array.
+    """
+    array = np.lib.format.open_memmap(os.path.join(path, name + '.tmp'), mode='w+', dtype=dtype, shape=shape)
+    array[:] = fill
+    return array
+
+def _commit_allocation(path, *names):
+    for name in names:
+        os.replace(os.path.join(path, name + '.tmp'), os.path.join(path, name))
+
+def _save_meta(path, meta):
+    tmp_path = os.path.join(path, 'meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, separators=(',', ':'))
+    os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+def update_cube(family, index=None, frequency=None, observations_dir=OBSERVATIONS_DIR,
+                cubes_dir=CUBES_DIR, fips_map_file=FIPS_MAP_FILE):
+    """
+    Creates or incrementally updates the cube for one series family.
+
+    Only series whose observation files changed since the last update are
+    re-read. Their rows are rewritten in place, and new periods go into the
+    spare capacity at the end of each row; the files are only reallocated
+    when data falls before the first period or past the capacity.
+    A reallocation is written to temporary files that replace the old ones
+    only once complete, and meta.json is saved last.
+    Series whose frequency differs from the cube's are skipped.
+    Returns the number of series written.
+    """
+    index = index or QueryIndex.open()
+    path = cube_dir(family, cubes_dir)
+    fips, state_rows = county_axis(fips_map_file)
+    row_of = {code: i for i, code in enumerate(fips)}
+
+    meta = None
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        # A different county axis or frequency means the layout changed
+        if meta['fips'] != fips or (frequency and meta['frequency'] != frequency):
+            meta = None
+
+    # 1. Collect the members whose observation files changed
+    changed = {}
+    signatures = {}
+    for fred_id in index.series_for_title(family):
+        county = index.series[fred_id][0]
+        obs_path = observations_path(fred_id, observations_dir)
+        if county not in row_of or not os.path.exists(obs_path):
+            continue
+        signature = _file_signature(obs_path)
+        signatures[fred_id] = signature
+        if meta and meta['series'].get(fred_id) == signature:
+            continue
+        series = load_series_observations(fred_id, observations_dir)
+        changed[fred_id] = series
+
+    if not changed and meta:
+        print(f"  = {family}: up to date")
+        return 0
+    if not changed:
+        print(f"  ! {family}: no observations found in {observations_dir}")
+        return 0
+
+    # 2. Pick the frequency (the cube's, or the most common among members)
+    if meta:
+        frequency = meta['frequency']
+    elif not frequency:
+        counts = Counter(s['frequency'] for s in changed.values() if s['frequency'] in PERIODS_PER_YEAR)
+        if not counts:
+            print(f"  ! {family}: no annual, quarterly or monthly series to materialize")
+            return 0
+        frequency = counts.most_common(1)[0][0]
+
+    rows = {}
+    skipped = 0
+    for fred_id, series in changed.items():
+        if series['frequency'] != frequency:
+            skipped += 1
+            continue
+        periods = period_indexes(series['dates'], frequency)
+        values = np.array([np.nan if v is None else v for v in series['values']], dtype=np.float32)
+        rows[fred_id] = (row_of[index.series[fred_id][0]], periods, values)
+
+    if meta and not rows:
+        # Only off-frequency series changed; remember them so they are not re-read
+        meta['series'].update({fred_id: signatures[fred_id] for fred_id in changed})
+        _save_meta(path, meta)
+        print(f"  = {family}: up to date (skipped {skipped} series at other frequencies)")
+        return 0
+
+    # 3. Work out the period range and whether the files must be reallocated
+    new_periods = [p for _, p, _ in rows.values() if len(p)]
+    lo = min((int(p.min()) for p in new_periods), default=None)
+    hi = max((int(p.max()) for p in new_periods), default=None)
+    if meta:
+        start = meta['start_period']
+        end = start + meta['n_periods'] - 1
+        lo = start if lo is None else min(lo, start)
+        hi = end if hi is None else max(hi, end)
+    if lo is None:
+        print(f"  ! {family}: changed series have no observations")
+        return 0
+
+    headroom = PERIODS_PER_YEAR[frequency] * CAPACITY_HEADROOM_YEARS
+    os.makedirs(path, exist_ok=True)
+
+    reallocated = not (meta and lo >= meta['start_period'] and hi < meta['start_period'] + meta['capacity'])
+    if not reallocated:
+        values_mm = np.load(os.path.join(path, 'values.npy'), mmap_mode='r+')
+        mask_mm = np.load(os.path.join(path, 'mask.npy'), mmap_mode='r+')
+        start, capacity = meta['start_period'], meta['capacity']
+    else:
+        capacity = hi - lo + 1 + headroom
+        old = None
+        if meta:
+            old = (np.load(os.path.join(path, 'values.npy')), np.load(os.path.join(path, 'mask.npy')),
+                   meta['start_period'] - lo, meta['n_periods'])
+        values_mm = _allocate(path, 'values.npy', (len(fips), capacity), np.float32, np.nan)
+        mask_mm = _allocate(path, 'mask.npy', (len(fips), capacity), np.bool_, False)
+        if old:
+            old_values, old_mask, offset, n = old
+            values_mm[:, offset:offset + n] = old_values[:, :n]
+            mask_mm[:, offset:offset + n] = old_mask[:, :n]
+        start = lo
+        print(f"  + {family}: allocated {len(fips)} counties x {capacity} periods ({frequency})")
+
+    # 4. Rewrite the rows of the changed series
+    for row, periods, values in rows.values():
+        values_mm[row, :] = np.nan
+        mask_mm[row, :] = False
+        columns = periods - start
+        values_mm[row, columns] = values
+        mask_mm[row, columns] = ~np.isnan(values)
+
+    values_mm.flush()
+    mask_mm.flush()
+    del values_mm, mask_mm
+    if reallocated:
+        _commit_allocation(path, 'values.npy', 'mask.npy')
+
+    series_signatures = dict(meta['series']) if meta else {}
+    series_signatures.update({fred_id: signatures[fred_id] for fred_id in changed})
+    _save_meta(path, {
+        'family': family,
+        'frequency': frequency,
+        'fips': fips,
+        'state_rows': state_rows,
+        'start_period': start,
+        'n_periods': hi - start + 1,
+        'capacity': capacity,
+        'series': series_signatures,
+        'token': uuid.uuid4().hex,
+    })
+
+    note = f", skipped {skipped} series at other frequencies" if skipped else ""
+    print(f"  ✓ {family}: wrote {len(rows)} series{note}")
+    return len(rows)
+
+def build_cubes(families=None, index=None, cubes_dir=CUBES_DIR):
+    """Creates or updates the cubes of every family (pipeline stage)."""
+    index = index or QueryIndex.open()
+    print(f"Updating series cubes in {cubes_dir}...")
+    for family in families or DEFAULT_FAMILIES:
+        update_cube(family, index=index, cubes_dir=cubes_dir)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Materialize series families as memory-mapped county x period cubes.")
+    parser.add_argument('families', nargs='*', help=f"series families (default: {', '.join(DEFAULT_FAMILIES)})")
+    args = parser.parse_args(argv)
+    build_cubes(args.families or None)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,174 @@
-def process_fred_map_file():
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from operator import itemgetter
+
+import requests
+
+from fred_records import SeriesRecordTable, split_series_title
+from fred_scheduler import Task, run_largest_first
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Set FRED_API_KEY in the environment, or replace the placeholder below.
+FRED_API_KEY = os.environ.get('FRED_API_KEY', 'YOUR_FRED_API_KEY')
+FRED_API_BASE_URL = 'https://api.stlouisfed.org/fred'
+
+INPUT_FILE = os.path.join(BASE_DIR, 'subs', 'fred_fips_map.json')
+OUTPUT_DIR = os.path.join(BASE_DIR, 'fred_county_series_output')
+
+# FRED allows up to 1000 series per category/series page
+SERIES_PAGE_LIMIT = 1000
+
+# FRED tags that select county-level series; added to every family's tags
+# in tag-based discovery
+COUNTY_GEOGRAPHY_TAGS = ['county']
+
+# Tags identifying each series family for tag-based discovery
+# (normalized series title -> FRED tag names)
+FAMILY_TAGS = {
+    'Unemployment Rate': ['unemployment', 'rate'],
+    'Civilian Labor Force': ['civilian', 'labor force'],
+    'Resident Population': ['resident', 'population'],
+    'Per Capita Personal Income': ['per capita', 'personal income'],
+}
+
+# Minimum seconds between FRED API requests. FRED allows 120 per minute;
+# 0.6 s (100 per minute) leaves a margin for clock jitter and retries.
+COUNTY_QUERY_DELAY = 0.6
+# Threads fetching category pages in process_fred_map_file()
+FETCH_WORKERS = 4
+# Rate-limited (429), server-side (5xx) and timed-out requests are retried
+# up to MAX_RETRIES times, waiting RETRY_BACKOFF, 2x, 4x... seconds (or the
+# server's Retry-After) in between
+MAX_RETRIES = 4
+RETRY_BACKOFF = 5.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def fred_api_get(url, params, timeout=30):
+    """
+    requests.get() for the FRED API that retries rate-limited, server-side
+    and timed-out requests with exponential backoff. Returns the decoded
+    JSON payload; raises requests.RequestException or ValueError once the
+    retries are used up or for any other error.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = requests.get(url, params=params, timeout=timeout)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                response.raise_for_status()
+                return response.json()
+            retry_after = response.headers.get('Retry-After', '')
+            delay = float(retry_after) if retry_after.isdigit() else RETRY_BACKOFF * 2 ** attempt
+            reason = f"HTTP {response.status_code}"
+        except (requests.Timeout, requests.ConnectionError) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = RETRY_BACKOFF * 2 ** attempt
+            reason = type(e).__name__
+        print(f"    {reason} from FRED, retrying in {delay:.0f}s ({attempt + 1}/{MAX_RETRIES})")
+        time.sleep(delay)
+
+def fetch_series_page(category_id, offset=0):
+    """
+    Fetches one page of the series listed under a FRED county category.
+    Returns (series, total_count), or (None, 0) if the request still
+    failed after retries.
+    """
+    # fred_fips_map.json stores category IDs as floats (e.g. 27336.0)
+    category_id = int(float(category_id))
+    params = {
+        'category_id': category_id,
+        'api_key': FRED_API_KEY,
+        'file_type': 'json',
+        'limit': SERIES_PAGE_LIMIT,
+        'offset': offset,
+    }
+    try:
+        payload = fred_api_get(f"{FRED_API_BASE_URL}/category/series", params, timeout=30)
+    except (requests.RequestException, ValueError) as e:
+        print(f"    Error fetching series for category {category_id}: {e}")
+        return None, 0
+    return payload.get('seriess', []), payload.get('count', 0)
+
+def fetch_fred_series(category_id):
+    """
+    Fetches every series listed under a FRED county category, following
+    the API's offset pagination. Returns a list of FRED series dicts.
+    """
+    series_list = []
+    offset = 0
+
+    while True:
+        page, count = fetch_series_page(category_id, offset)
+        if page is None:
+            break
+        series_list.extend(page)
+        offset += len(page)
+
+        if not page or offset >= count:
+            break
+
+    return series_list
+
+def normalize_series_title(full_series_title):
+    """
+    Strips the county-specific location phrase from a FRED series title
+    (e.g. 'Unemployment Rate in Autauga County, AL' -> 'Unemployment Rate').
+    """
+    # --- REVISED LOGIC TO EXTRACT NORMALIZED SERIES TITLE ---
+    normalized_title = full_series_title
+    
+    # Find the last occurrence of common locational prefixes
+    location_start_index_in = full_series_title.rfind(' in ')
+    location_start_index_for = full_series_title.rfind(' for ')
+    
+    # Determine which prefix (if any) is the latest in the string
+    # Note: ' in ' is 4 chars, ' for ' is 5 chars. We want the index where the stripping should start.
+    if location_start_index_in > location_start_index_for:
+        location_start_index = location_start_index_in
+        separator_length = 4 # length of ' in '
+    elif location_start_index_for > -1: # Only use ' for ' if it was found
+        location_start_index = location_start_index_for
+        separator_length = 5 # length of ' for '
+    else:
+        location_start_index = -1 # Neither found, use full title
+        
+    if location_start_index != -1:
+        # Look back from the detected separator index to find the preceding comma
+        comma_index = full_series_title.rfind(',', 0, location_start_index)
+        
+        if comma_index != -1:
+            # Use the part before the last comma found
+            normalized_title = full_series_title[:comma_index].strip()
+        else:
+            # Fallback: if no comma is found, use the part before the separator (e.g., ' for ' or ' in ')
+            normalized_title = full_series_title[:location_start_index].strip()
+
+    return normalized_title
+
+def process_fred_map_file(workers=FETCH_WORKERS):
     """
     Main function to read, sort, fetch FRED series, and composite 
     the results into state-level JSON files.
+
+    Category pages are fetched by `workers` threads, largest first by the
+    counties' Series_Count (see fred_scheduler.py), with requests spaced
+    COUNTY_QUERY_DELAY apart. Each state file is written as soon as all
+    its counties are done. A state with a page that failed (after retries)
+    is not written, so its previous file stays in place; RuntimeError
+    lists them at the end. A missing API key or input file also raises
+    RuntimeError.
     """
     
     if FRED_API_KEY == 'YOUR_FRED_API_KEY':
-        print("!!! ERROR: Please replace 'YOUR_FRED_API_KEY' with your actual FRED API key. !!!")
-        return
+        raise RuntimeError("!!! ERROR: Please replace 'YOUR_FRED_API_KEY' with your actual FRED API key. !!!")
 
     print(f"Starting FRED series lookup from {INPUT_FILE}...")
     
@@ -19,107 +181,301 @@ def process_fred_map_file():
         with open(INPUT_FILE, 'r', encoding='utf-8') as f:
             county_data_list = json.load(f)
     except Exception as e:
-        print(f"Error loading or decoding JSON from {INPUT_FILE}: {e}")
-        return
+        raise RuntimeError(f"Error loading or decoding JSON from {INPUT_FILE}: {e}") from e
 
     # 2. Sort the entire list by the 'State' field
     print("Sorting county data by state abbreviation...")
     sorted_county_data = sorted(county_data_list, key=itemgetter('State'))
     
-    # Group the sorted list into dictionaries keyed by state for sequential processing
+    # Group the sorted list into dictionaries keyed by state
     state_groups = defaultdict(list)
     for record in sorted_county_data:
         state_groups[record['State']].append(record)
 
     total_states = len(state_groups)
     print(f"Found {total_states} unique states to process.")
-    
-    states_processed_count = 0
 
-    # 3. Process State-by-State
+    # 3. One task per expected category page, sized by Series_Count
+    tasks = []
+    pages = {}           # (state, county number) -> {offset: [(id, units, title), ...]}
+    pending_pages = {}   # (state, county number) -> pages still to fetch
+    pending_counties = {state_abbr: 0 for state_abbr in state_groups}
+    failed_pages = defaultdict(list)   # state -> ['County (offset N)', ...]
+
     for state_abbr, counties_in_state in state_groups.items():
-        states_processed_count += 1
-        print(f"\n===== Processing State: **{state_abbr}** ({len(counties_in_state)} counties) =====")
-        
-        # Structure for the current state's results: Normalized_Series_Title -> [County_Record_1, ...]
-        state_results = defaultdict(list)
-        
-        # A. Process all counties within the current state
         for i, county_record in enumerate(counties_in_state):
-            county_name = county_record.get('County_Name', 'Unknown County')
             category_id = county_record.get('County_Category_ID')
-
-            print(f"  [{i+1}/{len(counties_in_state)}] Querying {county_name}...")
-
             if not category_id:
-                print(f"    Skipping {county_name} due to missing County_Category_ID.")
+                print(f"    Skipping {county_record.get('County_Name', 'Unknown County')} "
+                      f"due to missing County_Category_ID.")
                 continue
-                
-            series_list = fetch_fred_series(category_id)
-
-            # B. Composite Results by Normalized Series Title
-            for series in series_list:
-                full_series_title = series.get('title', 'Unknown Series Title')
-                
-                # --- REVISED LOGIC TO EXTRACT NORMALIZED SERIES TITLE ---
-                normalized_title = full_series_title
-                
-                # Find the last occurrence of common locational prefixes
-                location_start_index_in = full_series_title.rfind(' in ')
-                location_start_index_for = full_series_title.rfind(' for ')
-                
-                # Determine which prefix (if any) is the latest in the string
-                # Note: ' in ' is 4 chars, ' for ' is 5 chars. We want the index where the stripping should start.
-                if location_start_index_in > location_start_index_for:
-                    location_start_index = location_start_index_in
-                    separator_length = 4 # length of ' in '
-                elif location_start_index_for > -1: # Only use ' for ' if it was found
-                    location_start_index = location_start_index_for
-                    separator_length = 5 # length of ' for '
-                else:
-                    location_start_index = -1 # Neither found, use full title
-                    
-                if location_start_index != -1:
-                    # Look back from the detected separator index to find the preceding comma
-                    comma_index = full_series_title.rfind(',', 0, location_start_index)
-                    
-                    if comma_index != -1:
-                        # Use the part before the last comma found
-                        normalized_title = full_series_title[:comma_index].strip()
-                    else:
-                        # Fallback: if no comma is found, use the part before the separator (e.g., ' for ' or ' in ')
-                        normalized_title = full_series_title[:location_start_index].strip()
-
-                series_title_key = normalized_title
-                # -----------------------------------------------------------
-                
-                # Create the county-specific series record for the output
-                county_output_record = {
-                    "FIPS": county_record.get('FIPS'),
-                    "County_Name": county_record.get('County_Name'),
-                    "FRED_ID": series.get('id'),
-                    "Units": series.get('units'),
-                    "Full_Series_Title": full_series_title 
-                }
-                
-                state_results[series_title_key].append(county_output_record)
-
-            # C. County-Level Delay
-            time.sleep(COUNTY_QUERY_DELAY)
-            
-        # 4. Write Final State JSON File
+            key = (state_abbr, i)
+            expected = int(county_record.get('Series_Count') or 0)
+            offsets = range(0, max(expected, 1), SERIES_PAGE_LIMIT)
+            pages[key] = {}
+            pending_pages[key] = len(offsets)
+            pending_counties[state_abbr] += 1
+            for offset in offsets:
+                tasks.append(Task(key, min(max(expected - offset, 1), SERIES_PAGE_LIMIT), (category_id, offset)))
+
+    def fetch_page(payload):
+        category_id, offset = payload
+        page, count = fetch_series_page(category_id, offset)
+        return len(page or []), (page, count)
+
+    def write_state(state_abbr):
         output_filename = os.path.join(OUTPUT_DIR, f'{state_abbr}_fred_series.json')
-        print(f"--- Finished all counties for {state_abbr}. Writing output file... ---")
+        if failed_pages[state_abbr]:
+            print(f"!!! Not saving {output_filename}: {len(failed_pages[state_abbr])} page(s) failed: "
+                  f"{', '.join(failed_pages[state_abbr])}")
+            for i in range(len(state_groups[state_abbr])):
+                pages.pop((state_abbr, i), None)
+            return
+
+        # Composite results by normalized series title, in the original county order
+        state_results = SeriesRecordTable()
+        for i, county_record in enumerate(state_groups[state_abbr]):
+            county_pages = pages.pop((state_abbr, i), {})
+            for offset in sorted(county_pages):
+                for fred_id, units, full_series_title in county_pages[offset]:
+                    state_results.append(
+                        normalize_series_title(full_series_title),
+                        county_record.get('FIPS'),
+                        county_record.get('County_Name'),
+                        fred_id,
+                        units,
+                        full_series_title
+                    )
+
         try:
             with open(output_filename, 'w', encoding='utf-8') as f:
-                json.dump(state_results, f, indent=4)
+                state_results.write_json(f, indent=4)
             print(f"Successfully saved: **{output_filename}** ({len(state_results)} unique series titles)")
         except IOError as e:
             print(f"Error writing file {output_filename}: {e}")
-            
-        # 5. State-Level Delay
-        if states_processed_count < total_states:
-            print(f"Delaying for {STATE_COMPLETION_DELAY}s before starting the next state.")
-            time.sleep(STATE_COMPLETION_DELAY)
 
+    def page_done(task, result):
+        state_abbr, i = task.key
+        category_id, offset = task.payload
+        page, count = result
+        # Keep only the three fields written out; the raw series dicts
+        # (notes included) are dropped as soon as each page arrives, since
+        # most states only complete near the end of the run
+        pages[task.key][offset] = [
+            (series.get('id'), series.get('units'), series.get('title', 'Unknown Series Title'))
+            for series in page or []
+        ]
+        pending_pages[task.key] -= 1
+        if page is None:
+            county_name = state_groups[state_abbr][i].get('County_Name', 'Unknown County')
+            failed_pages[state_abbr].append(f"{county_name} (offset {offset})")
+
+        # Series_Count can be stale: queue the pages it did not account for
+        new_tasks = []
+        if offset == 0 and page is not None:
+            planned = max(int(state_groups[state_abbr][i].get('Series_Count') or 0), 1)
+            first_unplanned = len(range(0, planned, SERIES_PAGE_LIMIT)) * SERIES_PAGE_LIMIT
+            for extra in range(first_unplanned, count, SERIES_PAGE_LIMIT):
+                new_tasks.append(Task(task.key, min(count - extra, SERIES_PAGE_LIMIT), (category_id, extra)))
+            pending_pages[task.key] += len(new_tasks)
+
+        if pending_pages[task.key] == 0:
+            pending_counties[state_abbr] -= 1
+            if pending_counties[state_abbr] == 0:
+                write_state(state_abbr)
+        return new_tasks
+
+    # 4. Fetch every page, largest first, and write states as they complete
+    for state_abbr in [s for s, n in pending_counties.items() if n == 0]:
+        write_state(state_abbr)
+    print(f"Fetching {len(tasks)} category pages for {len(pending_pages)} counties with {workers} workers...")
+    run_largest_first(tasks, fetch_page, page_done, workers=workers,
+                      min_interval=COUNTY_QUERY_DELAY, label='pages')
+
+    incomplete = sorted(state_abbr for state_abbr, failures in failed_pages.items() if failures)
+    if incomplete:
+        raise RuntimeError(f"!!! Category pages failed for {len(incomplete)} state(s), not saved: "
+                           f"{', '.join(incomplete)}. Run again to retry them.")
     print("\nProcessing complete! 🎉")
+
+
+
+# --- Tag-based discovery ---
+
+def fetch_fred_series_by_tags(tag_names):
+    """
+    Fetches every series carrying all of the given FRED tags, following the
+    API's offset pagination (1000 series per request). Raises RuntimeError
+    if a page still fails after retries, rather than return a partial list.
+    """
+    series_list = []
+    offset = 0
+
+    while True:
+        params = {
+            'tag_names': ';'.join(tag_names),
+            'api_key': FRED_API_KEY,
+            'file_type': 'json',
+            'limit': SERIES_PAGE_LIMIT,
+            'offset': offset,
+        }
+        try:
+            payload = fred_api_get(f"{FRED_API_BASE_URL}/tags/series", params, timeout=60)
+        except (requests.RequestException, ValueError) as e:
+            raise RuntimeError(f"Error fetching series for tags {tag_names} at offset {offset}: {e}") from e
+
+        page = payload.get('seriess', [])
+        series_list.extend(page)
+        offset += len(page)
+        print(f"    Fetched {offset}/{payload.get('count', 0)} series tagged {';'.join(tag_names)}")
+
+        if not page or offset >= payload.get('count', 0):
+            break
+        time.sleep(COUNTY_QUERY_DELAY)
+
+    return series_list
+
+def county_location(full_series_title):
+    """
+    Returns the location named by a series title
+    (e.g. 'Unemployment Rate in Autauga County, AL' -> 'Autauga County, AL').
+    """
+    _, tail = split_series_title(full_series_title)
+    if not tail:
+        return None
+    return tail.split(' ', 2)[2].strip()
+
+def county_key(county_name, state_abbr=None):
+    """
+    Join key for a county name: (name casefolded with punctuation and spaces
+    removed, state), like subs/fred_mapping.clean_county_name() plus the
+    state. 'Alexandria city, VA' and 'Alexandria City, VA' give the same key.
+    """
+    name, separator, state = county_name.rpartition(',')
+    if not separator:
+        name, state = county_name, state_abbr or ''
+    return re.sub(r'[\W_]+', '', name).casefold(), state.strip().upper()
+
+def discover_series_by_tags(families=None, family_tags=FAMILY_TAGS, input_file=INPUT_FILE, output_dir=OUTPUT_DIR):
+    """
+    Alternative to process_fred_map_file() for a few series families: finds
+    every county's series of each family with one paged FRED tag search
+    instead of one category request per county, and maps the series back to
+    counties through the County_Name column of fred_fips_map.json.
+
+    The discovered families replace the same families in existing state
+    files; other series in those files are kept. A family whose tag search
+    fails part-way is left as it was in every state file, and
+    RuntimeError names it once the other families are written.
+    """
+    if FRED_API_KEY == 'YOUR_FRED_API_KEY':
+        raise RuntimeError("!!! ERROR: Please replace 'YOUR_FRED_API_KEY' with your actual FRED API key. !!!")
+
+    families = families or list(family_tags)
+    unknown = [family for family in families if family not in family_tags]
+    if unknown:
+        raise RuntimeError(f"!!! ERROR: No tags configured for {unknown}. Add them to FAMILY_TAGS. !!!")
+
+    try:
+        with open(input_file, 'r', encoding='utf-8') as f:
+            county_data_list = json.load(f)
+    except Exception as e:
+        raise RuntimeError(f"Error loading or decoding JSON from {input_file}: {e}") from e
+
+    # county_key() of County_Name (e.g. 'Autauga County, AL') -> county record
+    county_by_key = {
+        county_key(record['County_Name'], record.get('State')): record
+        for record in county_data_list
+        if record.get('County_Name') and record.get('FIPS')
+    }
+
+    # State -> Normalized_Series_Title -> [(FIPS, County_Name, FRED_ID, Units, Full_Series_Title), ...]
+    discovered = defaultdict(lambda: defaultdict(list))
+    request_families = {family.lower(): family for family in families}
+    failed_families = []
+
+    for family in families:
+        print(f"\n===== Discovering **{family}** by tags =====")
+        try:
+            family_series = fetch_fred_series_by_tags(family_tags[family] + COUNTY_GEOGRAPHY_TAGS)
+        except RuntimeError as e:
+            print(f"    ! {e}; keeping the stored {family} series")
+            failed_families.append(family)
+            continue
+        matched = unmatched = 0
+        for series in family_series:
+            full_series_title = series.get('title', '')
+            series_title_key = normalize_series_title(full_series_title)
+            # Tag searches also return related series (e.g. other age groups)
+            if request_families.get(series_title_key.lower()) != family:
+                continue
+            location = county_location(full_series_title)
+            county_record = county_by_key.get(county_key(location)) if location else None
+            if county_record is None:
+                unmatched += 1
+                continue
+            matched += 1
+            discovered[county_record['State']][series_title_key].append((
+                county_record.get('FIPS'),
+                county_record.get('County_Name'),
+                series.get('id'),
+                series.get('units'),
+                full_series_title,
+            ))
+        print(f"Matched {matched} county series for {family} ({unmatched} not in {os.path.basename(input_file)})")
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Write each state file: existing families first, then the discovered ones
+    for state_abbr in sorted(discovered):
+        output_filename = os.path.join(output_dir, f'{state_abbr}_fred_series.json')
+        state_results = SeriesRecordTable()
+        try:
+            with open(output_filename, 'r', encoding='utf-8') as f:
+                existing = json.load(f)
+            for series_title_key, records in existing.items():
+                if series_title_key not in discovered[state_abbr]:
+                    for record in records:
+                        state_results.append_record(series_title_key, record)
+            del existing
+        except FileNotFoundError:
+            pass
+
+        for series_title_key, rows in discovered[state_abbr].items():
+            for row in sorted(rows, key=lambda r: r[0]):
+                state_results.append(series_title_key, *row)
+
+        try:
+            with open(output_filename, 'w', encoding='utf-8') as f:
+                state_results.write_json(f, indent=4)
+            print(f"Successfully saved: **{output_filename}** ({len(state_results)} unique series titles)")
+        except IOError as e:
+            print(f"Error writing file {output_filename}: {e}")
+
+    if failed_families:
+        raise RuntimeError(f"!!! Tag search failed for {', '.join(failed_families)}; "
+                           f"those families were not updated. Run again to retry them.")
+    print("\nTag discovery complete! 🎉")
+
+
+# --- Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch FRED series for every county into state JSON files.")
+    parser.add_argument('--discovery', choices=['categories', 'tags'], default='categories',
+                        help="'categories' queries every county category; 'tags' finds whole families "
+                             "with a few tag searches")
+    parser.add_argument('--family', action='append', dest='families',
+                        help=f"family to discover in tags mode (repeatable; default: {', '.join(FAMILY_TAGS)})")
+    parser.add_argument('--workers', type=int, default=FETCH_WORKERS,
+                        help=f"threads fetching category pages (default: {FETCH_WORKERS})")
+    args = parser.parse_args()
+
+    try:
+        if args.discovery == 'tags':
+            discover_series_by_tags(args.families)
+        else:
+            process_fred_map_file(args.workers)
+    except RuntimeError as e:
+        print(f"\n{e}")
+        sys.exit(1)
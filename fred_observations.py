@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import requests
+
+from fred_fetch_all import FRED_API_BASE_URL, FRED_API_KEY, fred_api_get
+from fred_query import QueryIndex
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OBSERVATIONS_DIR = os.path.join(BASE_DIR, 'fred_observations')
+
+# Series families (normalized titles from the master file) downloaded by default
+DEFAULT_FAMILIES = [
+    'Unemployment Rate',
+    'Civilian Labor Force',
+    'Resident Population',
+    'Per Capita Personal Income',
+]
+
+# Minimum seconds between observation requests; like COUNTY_QUERY_DELAY in
+# fred_fetch_all.py, it stays under FRED's 120 requests per minute
+SERIES_QUERY_DELAY = 0.6
+# Failed series listed by name in the error raised at the end of a download
+FAILED_SERIES_SHOWN = 10
+
+# Median gap in days between observations -> FRED frequency code
+FREQUENCY_GAPS = [(2, 'D'), (10, 'W'), (45, 'M'), (135, 'Q'), (400, 'A')]
+
+
+def infer_frequency(dates):
+    """
+    Infers the FRED frequency code ('A', 'Q', 'M', 'W', 'D') of a sorted list
+    of 'YYYY-MM-DD' dates from the median gap between observations.
+    """
+    if len(dates) < 2:
+        return 'A'
+    days = [date.fromisoformat(d).toordinal() for d in dates]
+    gaps = sorted(b - a for a, b in zip(days, days[1:]))
+    median_gap = gaps[len(gaps) // 2]
+    for max_gap, frequency in FREQUENCY_GAPS:
+        if median_gap <= max_gap:
+            return frequency
+    return 'A'
+
+def observations_path(fred_id, observations_dir=OBSERVATIONS_DIR):
+    return os.path.join(observations_dir, f'{fred_id}.json')
+
+def load_series_observations(fred_id, observations_dir=OBSERVATIONS_DIR):
+    """
+    Loads a stored series as a dict with parallel 'dates' and 'values'
+    columns (missing values are None). Returns None if it was never fetched.
+    """
+    try:
+        with open(observations_path(fred_id, observations_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_series_observations(series, observations_dir=OBSERVATIONS_DIR):
+    path = observations_path(series['FRED_ID'], observations_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(series, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def fetch_series_observations(fred_id, observation_start=None):
+    """
+    Downloads the observations of one series. Returns (dates, values) lists;
+    FRED's '.' placeholder for missing values becomes None.
+    """
+    params = {
+        'series_id': fred_id,
+        'api_key': FRED_API_KEY,
+        'file_type': 'json',
+    }
+    if observation_start:
+        params['observation_start'] = observation_start
+
+    payload = fred_api_get(f"{FRED_API_BASE_URL}/series/observations", params, timeout=60)
+
+    dates = []
+    values = []
+    for obs in payload.get('observations', []):
+        dates.append(obs['date'])
+        values.append(None if obs['value'] == '.' else float(obs['value']))
+    return dates, values
+
+def merge_observations(stored, dates, values):
+    """
+    Merges newly fetched observations into a stored series in place.
+    Returns True if anything changed.
+    """
+    if not dates:
+        return False
+    existing = dict(zip(stored['dates'], stored['values']))
+    merged = dict(existing)
+    merged.update(zip(dates, values))
+    if merged == existing:
+        return False
+    stored['dates'] = sorted(merged)
+    stored['values'] = [merged[d] for d in stored['dates']]
+    stored['frequency'] = infer_frequency(stored['dates'])
+    return True
+
+def download_observations(families=None, index=None, observations_dir=OBSERVATIONS_DIR, refetch=False,
+                          vintages=False):
+    """
+    Downloads (or incrementally updates) the observations of every county
+    series in the given families into one columnar JSON file per series.
+    Already stored series are only asked for observations from their last
+    stored date on, unless refetch is True. With vintages=True, each
+    series' ALFRED revision history is stored as well and downloaded again
+    whenever FRED reports a revision newer than the stored vintages (see
+    fred_vintage.py).
+    Series that still fail after fred_api_get's retries are skipped, and a
+    RuntimeError listing them is raised once every family is done, so the
+    pipeline stage is not recorded as complete.
+    """
+    if FRED_API_KEY == 'YOUR_FRED_API_KEY':
+        raise RuntimeError("!!! ERROR: Please replace 'YOUR_FRED_API_KEY' with your actual FRED API key. !!!")
+
+    if vintages:
+        # Imported here because fred_vintage builds on this module
+        from fred_vintage import refresh_vintage_history
+
+    index = index or QueryIndex.open()
+    families = families or DEFAULT_FAMILIES
+    os.makedirs(observations_dir, exist_ok=True)
+    failed = []
+
+    for family in families:
+        fred_ids = index.series_for_title(family)
+        print(f"\n===== Observations for **{family}** ({len(fred_ids)} series) =====")
+        updated = 0
+
+        for i, fred_id in enumerate(fred_ids):
+            stored = None if refetch else load_series_observations(fred_id, observations_dir)
+            start = stored['dates'][-1] if stored and stored['dates'] else None
+            try:
+                dates, values = fetch_series_observations(fred_id, observation_start=start)
+            except (requests.RequestException, ValueError) as e:
+                print(f"  [{i+1}/{len(fred_ids)}] ! Error fetching {fred_id}: {e}")
+                failed.append(fred_id)
+                time.sleep(SERIES_QUERY_DELAY)
+                continue
+
+            if stored is None:
+                stored = {
+                    'FRED_ID': fred_id,
+                    'FIPS': index.series[fred_id][0],
+                    'frequency': infer_frequency(dates),
+                    'dates': dates,
+                    'values': values,
+                }
+                changed = True
+            else:
+                changed = merge_observations(stored, dates, values)
+
+            if changed:
+                save_series_observations(stored, observations_dir)
+                updated += 1
+
+            if vintages:
+                # Decided by the ALFRED vintages, not by `changed`: revisions
+                # to past dates leave the latest observations as they were
+                time.sleep(SERIES_QUERY_DELAY)
+                try:
+                    refresh_vintage_history(fred_id, force=refetch)
+                except (requests.RequestException, ValueError, KeyError) as e:
+                    print(f"  [{i+1}/{len(fred_ids)}] ! Error fetching vintages of {fred_id}: {e}")
+                    failed.append(f"{fred_id} (vintages)")
+            time.sleep(SERIES_QUERY_DELAY)
+
+        print(f"Updated {updated} of {len(fred_ids)} series for {family}.")
+
+    if failed:
+        shown = ', '.join(failed[:FAILED_SERIES_SHOWN]) + (', ...' if len(failed) > FAILED_SERIES_SHOWN else '')
+        raise RuntimeError(f"!!! Could not fetch {len(failed)} series ({shown}). "
+                           f"Run again to retry them; stored series are kept.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download county series observations into fred_observations/.")
+    parser.add_argument('families', nargs='*', help=f"series families (default: {', '.join(DEFAULT_FAMILIES)})")
+    parser.add_argument('--refetch', action='store_true', help="download full histories again")
+    parser.add_argument('--vintages', action='store_true',
+                        help="also store ALFRED revision histories as deltas (fred_observations/vintages/)")
+    args = parser.parse_args(argv)
+    try:
+        download_observations(args.families or None, refetch=args.refetch, vintages=args.vintages)
+    except RuntimeError as e:
+        print(e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
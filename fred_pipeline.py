@@ -0,0 +1,381 @@
+"""
+Runs the FRED county workflow as a dependency graph of stages.
+
+Each stage is a function in one of the existing scripts. A stage is skipped
+when the content hashes of its script, the local modules it uses, its input
+files and its parameters match the last successful run and its outputs
+still exist. Stages without inputs (the FIPS list and the scraped FRED
+county IDs, both committed under subs/) only run when their outputs are
+missing or they are forced. Scripts are imported only when their stage
+runs, so pandas/plotly/requests are never loaded for a no-op rebuild or
+--help.
+
+    python fred_pipeline.py                 # bring every stage up to date
+    python fred_pipeline.py fetch           # 'fetch' and the stages it depends on
+    python fred_pipeline.py --dry-run       # show what would run
+    python fred_pipeline.py --force vis     # rerun 'vis' even if up to date
+    python fred_pipeline.py --profile       # also write per-stage CPU profiles (--profile=mem: allocations)
+"""
+
+import argparse
+import glob
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(BASE_DIR, '.fred_pipeline_state.json')
+HASH_CHUNK_SIZE = 1 << 20
+
+# Stage graph. Paths are relative to BASE_DIR and may be glob patterns.
+# 'script'/'entry' name the function that runs the stage; 'modules' lists the
+# local modules whose code the stage runs, which are hashed with the script;
+# 'kwargs' are passed to it and are part of the stage fingerprint. An entry
+# function reports failure by raising; the stage's fingerprint is then not
+# recorded, even if outputs from an earlier run are still there.
+STAGES = {
+    'county_fips': {
+        'script': 'subs/county_fips.py',
+        'entry': 'build_county_fips_file',
+        'deps': [],
+        'inputs': [],
+        'outputs': ['subs/county_fips.json'],
+    },
+    'fred_county_ids': {
+        'script': 'subs/fred_county_scraper.py',
+        'entry': 'scrape_fred_county_ids',
+        'deps': [],
+        'inputs': [],
+        'outputs': ['subs/fred_county_ids.json'],
+    },
+    'fred_fips_map': {
+        'script': 'subs/fred_mapping.py',
+        'entry': 'generate_county_maps_with_correction',
+        'modules': ['fred_crosswalk'],
+        'deps': ['county_fips', 'fred_county_ids'],
+        'inputs': ['subs/county_fips.json', 'subs/fred_county_ids.json'],
+        'outputs': ['subs/fred_fips_map.json', 'subs/fips_no_match.json', 'subs/fred_no_match.json'],
+    },
+    'fetch': {
+        'script': 'fred_fetch_all.py',
+        'entry': 'process_fred_map_file',
+        'modules': ['fred_records', 'fred_scheduler'],
+        'deps': ['fred_fips_map'],
+        'inputs': ['subs/fred_fips_map.json'],
+        'outputs': ['fred_county_series_output/*_fred_series.json'],
+    },
+    'composite_master': {
+        'script': 'fred_composite_master.py',
+        'entry': 'consolidate_and_archive_fred_data',
+        'modules': ['fred_records'],
+        'deps': ['fetch'],
+        'inputs': ['fred_county_series_output/*_fred_series.json'],
+        'outputs': ['fred_county_series_output/fred_master_counties.json'],
+        # The state files are inputs of 'consolidate' too, so keep them
+        'kwargs': {
+            'output_dir': 'fred_county_series_output',
+            'master_filename': 'fred_master_counties.json',
+            'delete_originals': False,
+        },
+        'path_kwargs': ['output_dir'],
+    },
+    'consolidate': {
+        'script': 'fred_consolidate.py',
+        'entry': 'combine_state_data_by_series_title',
+        'modules': ['fred_records'],
+        'deps': ['fetch'],
+        'inputs': ['fred_county_series_output/*_fred_series.json'],
+        'outputs': ['fred_by_series_title.json'],
+    },
+    'query_index': {
+        'script': 'fred_query.py',
+        'entry': 'build_query_index',
+        'deps': ['composite_master'],
+        'inputs': ['fred_county_series_output/fred_master_counties.json'],
+        'outputs': ['fred_query_index.json'],
+    },
+    'search_index': {
+        'script': 'fred_search.py',
+        'entry': 'build_search_index',
+        'modules': ['fred_query'],
+        'deps': ['query_index'],
+        'inputs': ['fred_query_index.json'],
+        'outputs': ['fred_search_index/meta.json'],
+    },
+    'observations': {
+        'script': 'fred_observations.py',
+        'entry': 'download_observations',
+        'modules': ['fred_fetch_all', 'fred_query'],
+        'deps': ['query_index'],
+        'inputs': ['fred_query_index.json'],
+        'outputs': ['fred_observations/*.json'],
+    },
+    'cubes': {
+        'script': 'fred_cube.py',
+        'entry': 'build_cubes',
+        'modules': ['fred_observations', 'fred_query'],
+        'deps': ['observations', 'fred_fips_map'],
+        'inputs': ['fred_observations/*.json', 'subs/fred_fips_map.json'],
+        'outputs': ['fred_cubes/*/meta.json'],
+    },
+    'rollups': {
+        'script': 'fred_rollup.py',
+        'entry': 'build_rollups',
+        'modules': ['fred_cube'],
+        'deps': ['cubes'],
+        'inputs': ['fred_cubes/*/meta.json'],
+        'outputs': ['fred_rollups/*.npz'],
+    },
+    'maps': {
+        'script': 'fred_vis_batch.py',
+        'entry': 'render_all_maps',
+        'modules': ['fred_observations', 'fred_regional', 'fred_scheduler', 'fred_vis'],
+        'deps': ['consolidate', 'observations'],
+        'inputs': ['fred_by_series_title.json', 'fred_observations/*.json'],
+        'outputs': ['fred_maps/manifest.json'],
+    },
+    'vis': {
+        'script': 'fred_vis.py',
+        'entry': 'main',
+        'deps': ['fred_fips_map'],
+        'inputs': ['subs/fred_fips_map.json'],
+        'outputs': ['fred_county_map.html'],
+        'kwargs': {'output_html': 'fred_county_map.html'},
+        'path_kwargs': ['output_html'],
+    },
+}
+
+
+# --- Hashing ---
+
+def _expand(pattern):
+    """Returns the sorted absolute paths matching a BASE_DIR-relative pattern."""
+    return sorted(glob.glob(os.path.join(BASE_DIR, pattern)))
+
+def _file_digest(path, state):
+    """
+    Returns the sha256 of a file. Digests are cached by (size, mtime) in the
+    state file so unchanged inputs are not re-read on every run.
+    """
+    st = os.stat(path)
+    rel = os.path.relpath(path, BASE_DIR)
+    cached = state['files'].get(rel)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    state['files'][rel] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+def stage_fingerprint(name, state):
+    """
+    Hashes everything a stage's result depends on: its script and local
+    modules, the content of every file matched by its inputs, and its
+    parameters.
+    """
+    stage = STAGES[name]
+    h = hashlib.sha256()
+    h.update(name.encode())
+    for script in [stage['script']] + [module + '.py' for module in stage.get('modules', [])]:
+        h.update(script.encode())
+        h.update(_file_digest(os.path.join(BASE_DIR, script), state).encode())
+    for pattern in stage['inputs']:
+        h.update(pattern.encode())
+        for path in _expand(pattern):
+            h.update(os.path.relpath(path, BASE_DIR).encode())
+            h.update(_file_digest(path, state).encode())
+    h.update(json.dumps(stage.get('kwargs', {}), sort_keys=True).encode())
+    return h.hexdigest()
+
+def outputs_exist(name):
+    return all(_expand(pattern) for pattern in STAGES[name]['outputs'])
+
+
+# --- State ---
+
+def load_state():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+    state.setdefault('stages', {})
+    state.setdefault('files', {})
+    return state
+
+def save_state(state):
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, STATE_FILE)
+
+
+# --- Graph ---
+
+def resolve_order(targets):
+    """
+    Returns the targets and all of their dependencies in topological order.
+    Raises ValueError for unknown stages or dependency cycles.
+    """
+    order = []
+    visiting = set()
+    done = set()
+
+    def visit(name):
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage '{name}'. Known stages: {', '.join(STAGES)}")
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle detected at stage '{name}'")
+        visiting.add(name)
+        for dep in STAGES[name]['deps']:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for target in targets:
+        visit(target)
+    return order
+
+def load_stage_function(name):
+    """
+    Imports a stage's script (lazily) under its own module name and returns
+    its entry function. The real name matters for stages that use a process
+    pool: workers started with spawn/forkserver unpickle functions by module
+    name and must be able to import it themselves.
+    """
+    stage = STAGES[name]
+    script_dir, script_file = os.path.split(os.path.join(BASE_DIR, stage['script']))
+    # Stage scripts import shared modules (e.g. fred_records) from BASE_DIR
+    for path in (BASE_DIR, script_dir):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    module = importlib.import_module(os.path.splitext(script_file)[0])
+    return getattr(module, stage['entry'])
+
+def stage_kwargs(name):
+    stage = STAGES[name]
+    kwargs = dict(stage.get('kwargs', {}))
+    for key in stage.get('path_kwargs', []):
+        kwargs[key] = os.path.join(BASE_DIR, kwargs[key])
+    return kwargs
+
+
+# --- Execution ---
+
+def run_stage(name):
+    load_stage_function(name)(**stage_kwargs(name))
+
+def run_pipeline(targets=None, force=(), dry_run=False, profile=None):
+    """
+    Brings the requested stages (default: all) up to date. Stages named in
+    force run regardless of their fingerprint. With profile='cpu' or 'mem'
+    every stage that runs is profiled in that mode (see fred_profile.py).
+    Returns the list of stages that ran (or would run, for a dry run).
+    """
+    order = resolve_order(targets or list(STAGES))
+    force = set(force)
+    state = load_state()
+    ran = []
+
+    if profile and not dry_run:
+        from fred_profile import new_run_dir, profile_stage
+        report_dir = new_run_dir()
+        print(f"Writing stage profiles to {report_dir}")
+
+    for name in order:
+        # A dry run cannot know the new outputs of an upstream stage that
+        # would run, so anything downstream of it is reported as stale too.
+        upstream_stale = dry_run and any(dep in ran for dep in STAGES[name]['deps'])
+        fingerprint = stage_fingerprint(name, state)
+        previous = state['stages'].get(name, {}).get('fingerprint')
+
+        if name not in force and not upstream_stale and fingerprint == previous and outputs_exist(name):
+            print(f"  = {name}: up to date")
+            continue
+        # Nothing to compare against: keep the existing (committed) output
+        # rather than re-download it
+        if name not in force and not STAGES[name]['inputs'] and outputs_exist(name):
+            print(f"  = {name}: outputs exist (no inputs; --force {name} to rebuild)")
+            continue
+
+        ran.append(name)
+        if dry_run:
+            print(f"  > {name}: would run")
+            continue
+
+        print(f"\n===== Running stage: **{name}** =====")
+        started = time.perf_counter()
+        try:
+            if profile:
+                with profile_stage(name, report_dir, 'cpu' if profile is True else profile):
+                    run_stage(name)
+            else:
+                run_stage(name)
+        except RuntimeError as e:
+            save_state(state)
+            raise RuntimeError(f"Stage '{name}' failed: {e}") from e
+        elapsed = time.perf_counter() - started
+
+        if not outputs_exist(name):
+            save_state(state)
+            raise RuntimeError(f"Stage '{name}' finished without producing {STAGES[name]['outputs']}")
+
+        state['stages'][name] = {
+            'fingerprint': fingerprint,
+            'seconds': round(elapsed, 3),
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        save_state(state)
+        print(f"===== Stage {name} finished in {elapsed:.1f}s =====")
+
+    # Persist refreshed file digests even when nothing ran
+    if not dry_run:
+        save_state(state)
+    return ran
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the FRED county pipeline, skipping stages whose inputs are unchanged.")
+    parser.add_argument('stages', nargs='*', help="stages to bring up to date (default: all)")
+    parser.add_argument('--force', action='append', default=[], metavar='STAGE',
+                        help="rerun STAGE even if it is up to date (repeatable; 'all' for every stage)")
+    parser.add_argument('--dry-run', action='store_true', help="only report which stages would run")
+    parser.add_argument('--list', action='store_true', help="list stages and their dependencies")
+    parser.add_argument('--profile', nargs='?', const='cpu', choices=['cpu', 'mem'],
+                        help="profile each stage that runs: CPU (default) or memory allocations "
+                             "(reports in fred_profiles/)")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in resolve_order(list(STAGES)):
+            deps = ', '.join(STAGES[name]['deps']) or '-'
+            print(f"{name:<18} <- {deps}")
+        return 0
+
+    force = set(STAGES) if 'all' in args.force else set(args.force)
+    try:
+        for name in force:
+            resolve_order([name])
+        run_pipeline(args.stages, force=force, dry_run=args.dry_run, profile=args.profile)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    except RuntimeError as e:
+        print(f"\n!!! {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+CPU and memory profiling for pipeline stages and scripts.
+
+    python fred_pipeline.py --profile fetch           # CPU profile of every stage that runs
+    python fred_pipeline.py --profile=mem fetch       # allocation profile instead
+    python fred_profile.py fred_vis.py                # CPU profile of any script's __main__
+    python fred_profile.py --mem fred_vis.py          # allocation profile of a script
+
+CPU and memory are measured in separate runs: tracemalloc slows
+allocation-heavy code (JSON parsing) by an order of magnitude, which would
+swamp the CPU timings and stack samples.
+
+A CPU run writes to fred_profiles/<run>/:
+
+    <stage>.prof     cProfile stats (snakeviz, gprof2dot, flameprof, pstats)
+    <stage>.folded   sampled call stacks in collapsed format (flamegraph.pl, speedscope)
+    <stage>.txt      wall/CPU time and the top functions
+
+A memory run writes <stage>.mem.txt: peak traced memory and the top
+allocation sites and tracebacks near the peak.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_DIR = os.path.join(BASE_DIR, 'fred_profiles')
+
+MODES = ('cpu', 'mem')
+
+# Seconds between call-stack samples for the .folded flame graph input
+SAMPLE_INTERVAL = 0.005
+# Frames kept per allocation traceback
+TRACEMALLOC_FRAMES = 10
+# In memory runs, a new allocation snapshot is taken when traced memory
+# grows past the last snapshot by this factor (checked every PEAK_CHECK_INTERVAL s)
+PEAK_SNAPSHOT_GROWTH = 1.1
+PEAK_CHECK_INTERVAL = 0.1
+# Rows in each table of the .txt report
+REPORT_TOP = 25
+
+
+def new_run_dir(profiles_dir=PROFILES_DIR):
+    """Creates fred_profiles/<timestamp>/ for one profiled run."""
+    path = os.path.join(profiles_dir, time.strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class _StackSampler(threading.Thread):
+    """
+    Samples the call stacks of every other thread at a fixed interval (CPU
+    runs). Each stack starts with the thread's name, so worker threads show
+    up as their own towers in the flame graph.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if names:
+                    names.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+                    self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class _ThreadProfilers:
+    """
+    Gives every thread started inside a CPU run its own cProfile.Profile
+    (cProfile only sees the thread that enabled it). Installed with
+    threading.setprofile; the first profile event of a new thread swaps
+    the hook for that thread's profiler.
+    """
+
+    def __init__(self):
+        self.profilers = []
+        self._lock = threading.Lock()
+
+    def __call__(self, frame, event, arg):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ profiles through sys.monitoring, where the stage's
+            # profiler already covers every thread and a second one can't start
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self.profilers.append(profiler)
+
+    def install(self):
+        threading.setprofile(self)
+
+    def uninstall(self):
+        threading.setprofile(None)
+
+
+class _PeakSnapshotter(threading.Thread):
+    """Keeps a tracemalloc snapshot taken near the point of peak memory use (memory runs)."""
+
+    def __init__(self, interval=PEAK_CHECK_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.snapshot = None
+        self.snapshot_size = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self.snapshot_size * PEAK_SNAPSHOT_GROWTH:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_size = current
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+@contextmanager
+def profile_stage(name, report_dir=None, mode='cpu'):
+    """
+    Profiles the enclosed block and writes the reports for `mode` to
+    report_dir: cProfile plus a stack sampler for 'cpu', tracemalloc for
+    'mem'. CPU runs cover every thread: threads started inside the block
+    get their own profiler, merged into the stage's stats.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'. Choose from {', '.join(MODES)}")
+    report_dir = report_dir or new_run_dir()
+    os.makedirs(report_dir, exist_ok=True)
+
+    if mode == 'mem':
+        with _memory_profile(name, report_dir):
+            yield
+        return
+
+    sampler = _StackSampler()
+    profiler = cProfile.Profile()
+    thread_profilers = _ThreadProfilers()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    sampler.start()
+    thread_profilers.install()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        thread_profilers.uninstall()
+        sampler.stop()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        _write_cpu_reports(name, report_dir, [profiler, *thread_profilers.profilers], sampler.stacks, wall, cpu)
+
+@contextmanager
+def _memory_profile(name, report_dir):
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    snapshotter = _PeakSnapshotter()
+    wall_start = time.perf_counter()
+    snapshotter.start()
+    try:
+        yield
+    finally:
+        snapshotter.stop()
+        wall = time.perf_counter() - wall_start
+        current, peak = tracemalloc.get_traced_memory()
+        # Report what was allocated near the peak, unless the stage ended
+        # holding more than that
+        if snapshotter.snapshot is not None and snapshotter.snapshot_size > current:
+            snapshot, snapshot_size = snapshotter.snapshot, snapshotter.snapshot_size
+        else:
+            snapshot, snapshot_size = tracemalloc.take_snapshot(), current
+        tracemalloc.stop()
+        _write_memory_report(name, report_dir, snapshot, snapshot_size, wall, peak)
+
+def _write_cpu_reports(name, report_dir, profilers, stacks, wall, cpu):
+    base = os.path.join(report_dir, name)
+    stats = pstats.Stats(*profilers)
+    stats.dump_stats(base + '.prof')
+
+    with open(base + '.folded', 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    stats_text = io.StringIO()
+    stats.stream = stats_text
+    stats.sort_stats('cumulative').print_stats(REPORT_TOP)
+    stats.sort_stats('tottime').print_stats(REPORT_TOP)
+
+    with open(base + '.txt', 'w', encoding='utf-8') as f:
+        f.write(f"Stage: {name}\n")
+        f.write(f"Wall time: {wall:.3f}s   CPU time: {cpu:.3f}s   Threads profiled: {len(profilers)}\n\n")
+        f.write("--- Functions ---\n")
+        f.write(stats_text.getvalue())
+
+    print(f"CPU profile for {name}: {base}.txt (wall {wall:.1f}s, CPU {cpu:.1f}s)")
+
+def _write_memory_report(name, report_dir, snapshot, snapshot_size, wall, peak):
+    path = os.path.join(report_dir, name + '.mem.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"Stage: {name}\n")
+        f.write(f"Wall time under tracemalloc: {wall:.3f}s   Peak traced memory: {peak / 2**20:.1f} MiB\n\n")
+        f.write(f"--- Top {REPORT_TOP} allocation sites (snapshot at {snapshot_size / 2**20:.1f} MiB traced) ---\n")
+        for stat in snapshot.statistics('lineno')[:REPORT_TOP]:
+            f.write(f"{stat.size / 1024:10.1f} KiB  {stat.count:8d} blocks  {stat.traceback[0]}\n")
+        f.write("\n--- Top 5 allocation tracebacks ---\n")
+        for stat in snapshot.statistics('traceback')[:5]:
+            f.write(f"\n{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+            for line in stat.traceback.format():
+                f.write(line + "\n")
+
+    print(f"Memory profile for {name}: {path} (peak {peak / 2**20:.1f} MiB)")
+
+
+def profile_script(script_path, args=(), report_dir=None, mode='cpu'):
+    """Runs a script as __main__ under profile_stage, with sys.argv set to args."""
+    name = os.path.splitext(os.path.basename(script_path))[0]
+    saved_argv = sys.argv
+    sys.argv = [script_path, *args]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script_path)))
+    try:
+        with profile_stage(name, report_dir, mode):
+            try:
+                runpy.run_path(script_path, run_name='__main__')
+            except SystemExit:
+                pass
+    finally:
+        sys.argv = saved_argv
+        sys.path.pop(0)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print("usage: python fred_profile.py [--mem] SCRIPT [ARGS ...]\n\n" + __doc__.strip())
+        return 0
+    mode = 'cpu'
+    if argv[0] in ('--mem', '--cpu'):
+        mode, argv = argv[0][2:], argv[1:]
+    profile_script(argv[0], argv[1:], mode=mode)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MASTER_FILE = os.path.join(BASE_DIR, 'fred_county_series_output', 'fred_master_counties.json')
+INDEX_FILE = os.path.join(BASE_DIR, 'fred_query_index.json')
+INDEX_FORMAT_VERSION = 1
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+# Columns of each entry in the 'series' table of the index
+SERIES_COLUMNS = ('FIPS', 'County_Name', 'State', 'Units', 'Series_Title', 'Full_Series_Title')
+
+
+def normalize_key(text):
+    """Lookup key for titles and units: lowercased, single-spaced."""
+    if text is None:
+        return ''
+    return re.sub(r'\s+', ' ', str(text)).strip().lower()
+
+def _source_signature(path, previous=None):
+    """
+    Returns {size, mtime_ns, sha256} for the source file. The sha256 is reused
+    from `previous` when size and mtime are unchanged, so checking a large
+    master file for changes does not re-read it.
+    """
+    st = os.stat(path)
+    if previous and previous.get('size') == st.st_size and previous.get('mtime_ns') == st.st_mtime_ns:
+        return dict(previous)
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': h.hexdigest()}
+
+
+class QueryIndex:
+    """
+    Inverted indexes over the master dataset:
+
+    - series:   FRED_ID -> [FIPS, County_Name, State, Units, Series_Title, Full_Series_Title]
+    - by_fips:  FIPS -> [FRED_ID, ...]
+    - by_title: normalized series title -> [FRED_ID, ...]
+    - by_units: normalized units -> [FRED_ID, ...]
+
+    Build it once with QueryIndex.build() / save(), then load() it; every
+    lookup is a dict access.
+    """
+
+    def __init__(self, series, by_fips, by_title, by_units, titles, source):
+        self.series = series
+        self.by_fips = by_fips
+        self.by_title = by_title
+        self.by_units = by_units
+        # normalized title -> title as it appears in the master file
+        self.titles = titles
+        self.source = source
+
+    @property
+    def version(self):
+        """Identifies the data the index was built from (used for ETags)."""
+        return self.source.get('sha256', '')[:16]
+
+    @classmethod
+    def build(cls, master_file=MASTER_FILE):
+        """Scans the master file once and builds all indexes."""
+        source = _source_signature(master_file)
+        with open(master_file, 'r', encoding='utf-8') as f:
+            master_data = json.load(f)
+
+        series = {}
+        by_fips = {}
+        by_title = {}
+        by_units = {}
+        titles = {}
+
+        for state_abbr, state_data in master_data.items():
+            for series_title, records in state_data.items():
+                title_key = normalize_key(series_title)
+                titles.setdefault(title_key, series_title)
+                for record in records:
+                    fred_id = record.get('FRED_ID')
+                    if not fred_id:
+                        continue
+                    fips = record.get('FIPS')
+                    series[fred_id] = [
+                        fips,
+                        record.get('County_Name'),
+                        state_abbr,
+                        record.get('Units'),
+                        series_title,
+                        record.get('Full_Series_Title'),
+                    ]
+                    if fips:
+                        by_fips.setdefault(fips, []).append(fred_id)
+                    by_title.setdefault(title_key, []).append(fred_id)
+                    by_units.setdefault(normalize_key(record.get('Units')), []).append(fred_id)
+
+        return cls(series, by_fips, by_title, by_units, titles, source)
+
+    def save(self, index_file=INDEX_FILE):
+        payload = {
+            'format_version': INDEX_FORMAT_VERSION,
+            'source': self.source,
+            'series': self.series,
+            'by_fips': self.by_fips,
+            'by_title': self.by_title,
+            'by_units': self.by_units,
+            'titles': self.titles,
+        }
+        tmp_path = index_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(tmp_path, index_file)
+
+    @classmethod
+    def load(cls, index_file=INDEX_FILE):
+        with open(index_file, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        if payload.get('format_version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"{index_file} has an unsupported index format; rebuild it")
+        return cls(payload['series'], payload['by_fips'], payload['by_title'],
+                   payload['by_units'], payload['titles'], payload['source'])
+
+    @classmethod
+    def open(cls, master_file=MASTER_FILE, index_file=INDEX_FILE):
+        """
+        Loads the persisted index, rebuilding and saving it first if it is
+        missing or was built from a different version of the master file.
+        """
+        try:
+            index = cls.load(index_file)
+            if _source_signature(master_file, index.source)['sha256'] == index.source.get('sha256'):
+                return index
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        index = cls.build(master_file)
+        index.save(index_file)
+        return index
+
+    # --- Lookups ---
+
+    def series_info(self, fred_id):
+        row = self.series.get(fred_id)
+        if row is None:
+            return None
+        info = dict(zip(SERIES_COLUMNS, row))
+        info['FRED_ID'] = fred_id
+        return info
+
+    def series_for_fips(self, fips):
+        """FRED_IDs available for a 5-digit county FIPS code."""
+        return self.by_fips.get(str(fips).zfill(5), [])
+
+    def series_for_title(self, title):
+        """FRED_IDs of every county's series with this normalized title."""
+        return self.by_title.get(normalize_key(title), [])
+
+    def counties_for_title(self, title):
+        """Sorted FIPS codes of the counties that have a series with this title."""
+        return sorted({self.series[fred_id][0] for fred_id in self.series_for_title(title)
+                       if self.series[fred_id][0]})
+
+    def series_for_units(self, units):
+        return self.by_units.get(normalize_key(units), [])
+
+
+# --- Build stage ---
+
+def build_query_index(master_file=MASTER_FILE, index_file=INDEX_FILE):
+    """Builds the query index from the master file and saves it (pipeline stage)."""
+    started = time.perf_counter()
+    index = QueryIndex.build(master_file)
+    index.save(index_file)
+    print(f"✅ Indexed {len(index.series)} series across {len(index.by_fips)} counties "
+          f"and {len(index.by_title)} series titles in {time.perf_counter() - started:.1f}s")
+    print(f"Index saved to: {index_file}")
+
+
+# --- HTTP endpoint ---
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    Read-only JSON API over a shared QueryIndex:
+
+        GET /series/<FRED_ID>
+        GET /fips/<FIPS>
+        GET /title?q=<series title>
+        GET /units?q=<units>
+        GET /search?q=<text>&limit=<n>     ranked series (fred_search.py)
+        GET /suggest?q=<text>&limit=<n>    series titles for autocomplete
+
+    Responses carry an ETag derived from the index version and the request,
+    honour If-None-Match, and are gzipped when the client accepts it.
+    """
+    index = None
+    search_index = None
+    server_version = 'FredQuery/1.0'
+
+    def do_GET(self):
+        status, payload = self.route(urlsplit(self.path))
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        gzipped = len(body) >= GZIP_MIN_BYTES and 'gzip' in (self.headers.get('Accept-Encoding') or '')
+
+        # The gzip and identity representations are different bytes, so they
+        # get different (strong) ETags
+        etag = '"%s-%s%s"' % (self.index.version, hashlib.sha1(self.path.encode()).hexdigest()[:16],
+                              '-gz' if gzipped else '')
+        if status == 200 and etag in (self.headers.get('If-None-Match') or ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if status == 200:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if gzipped:
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, url):
+        """Returns (status, payload) for a parsed request URL."""
+        index = self.index
+        parts = [unquote(part) for part in url.path.strip('/').split('/') if part]
+        params = parse_qs(url.query)
+        query = params.get('q', [''])[0]
+
+        if len(parts) == 2 and parts[0] == 'series':
+            info = index.series_info(parts[1])
+            if info is None:
+                return 404, {'error': f"Unknown FRED_ID '{parts[1]}'"}
+            return 200, info
+        if len(parts) == 2 and parts[0] == 'fips':
+            fred_ids = index.series_for_fips(parts[1])
+            return 200, {'FIPS': parts[1].zfill(5), 'series': [index.series_info(i) for i in fred_ids]}
+        if parts == ['title']:
+            fred_ids = index.series_for_title(query)
+            counties = [{'FIPS': index.series[i][0], 'County_Name': index.series[i][1], 'FRED_ID': i}
+                        for i in fred_ids]
+            return 200, {'title': index.titles.get(normalize_key(query), query), 'counties': counties}
+        if parts == ['units']:
+            return 200, {'units': query, 'series': index.series_for_units(query)}
+        if parts in (['search'], ['suggest']) and self.search_index is not None:
+            try:
+                limit = min(max(int(params.get('limit', ['20'])[0]), 1), 200)
+            except ValueError:
+                return 400, {'error': 'limit must be an integer'}
+            if parts == ['suggest']:
+                return 200, {'q': query, 'titles': self.search_index.suggest(query, limit)}
+            results = []
+            for fred_id, score in self.search_index.search(query, limit):
+                info = index.series_info(fred_id) or {'FRED_ID': fred_id}
+                info['score'] = score
+                results.append(info)
+            return 200, {'q': query, 'series': results}
+        return 404, {'error': 'Unknown endpoint. Try /series/<id>, /fips/<fips>, /title?q=, /units?q=, '
+                              '/search?q=, /suggest?q='}
+
+    def log_message(self, format, *args):
+        sys.stderr.write("%s - %s\n" % (self.address_string(), format % args))
+
+def serve(index, host=DEFAULT_HOST, port=DEFAULT_PORT, search_index=None):
+    """Serves `index` (and /search, /suggest when a SearchIndex is given) over HTTP until interrupted."""
+    handler = type('BoundQueryRequestHandler', (QueryRequestHandler,),
+                   {'index': index, 'search_index': search_index})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving {len(index.series)} series at http://{host}:{port}/ (Ctrl+C to stop)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+# --- Execution ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the FRED county master dataset through inverted indexes.")
+    parser.add_argument('--master', default=MASTER_FILE, help="master JSON file")
+    parser.add_argument('--index', default=INDEX_FILE, help="persisted index file")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help="rebuild and save the index")
+    sub.add_parser('fips', help="series available for a county").add_argument('fips')
+    sub.add_parser('title', help="counties with a series title").add_argument('title')
+    sub.add_parser('units', help="series with given units").add_argument('units')
+    serve_parser = sub.add_parser('serve', help="serve the index as a local JSON endpoint")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST)
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        build_query_index(args.master, args.index)
+        return 0
+
+    index = QueryIndex.open(args.master, args.index)
+    if args.command == 'fips':
+        result = [index.series_info(i) for i in index.series_for_fips(args.fips)]
+    elif args.command == 'title':
+        result = index.counties_for_title(args.title)
+    elif args.command == 'units':
+        result = index.series_for_units(args.units)
+    else:
+        from fred_search import SearchIndex
+        serve(index, args.host, args.port, SearchIndex.open(args.master, args.index))
+        return 0
+    print(json.dumps(result, indent=4))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+from array import array
+import json
+
+# --- Configuration ---
+
+# Field order of a county series record, as written by fred_fetch_all.py
+RECORD_FIELDS = ("FIPS", "County_Name", "FRED_ID", "Units", "Full_Series_Title")
+
+# Location phrases that start the county-specific tail of a series title
+LOCATION_SEPARATORS = (" in ", " for ")
+
+
+def split_series_title(full_title):
+    """
+    Splits a full series title into (head, tail) at the last ' in ' or ' for '
+    (e.g. 'Unemployment Rate' + ' in Autauga County, AL'). The head is shared
+    by every county in a series family and the tail by every series of a
+    county, so both intern well. head + tail always equals full_title.
+    """
+    if not isinstance(full_title, str):
+        return full_title, None
+    split_at = max(full_title.rfind(sep) for sep in LOCATION_SEPARATORS)
+    if split_at == -1:
+        return full_title, None
+    return full_title[:split_at], full_title[split_at:]
+
+
+class StringPool:
+    """
+    Dictionary encoder for repeated values. Each distinct value is stored
+    once and referred to by a small integer code; code 0 is None.
+    """
+    __slots__ = ("_codes", "_values")
+
+    def __init__(self):
+        self._codes = {None: 0}
+        self._values = [None]
+
+    def encode(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self._values)
+            self._codes[value] = code
+            self._values.append(value)
+        return code
+
+    def decode(self, code):
+        return self._values[code]
+
+    def __len__(self):
+        return len(self._values)
+
+
+class SeriesRecordTable:
+    """
+    Compact replacement for the {Normalized_Series_Title: [record, ...]}
+    dicts built by the fetch and consolidation scripts.
+
+    Records are stored column-wise as arrays of StringPool codes instead of
+    one dict per record, and the title is split into a family head and a
+    county tail so neither is repeated per record. The JSON written by
+    write_json() is identical to json.dump() of the equivalent dict.
+    """
+    __slots__ = ("pool", "_groups", "_fips", "_county", "_fred_id", "_units", "_title_head", "_title_tail")
+
+    def __init__(self, pool=None):
+        # Tables can share a pool so strings repeated across states are stored once
+        self.pool = pool if pool is not None else StringPool()
+        # group key -> row numbers, in insertion order
+        self._groups = {}
+        self._fips = array("I")
+        self._county = array("I")
+        self._fred_id = array("I")
+        self._units = array("I")
+        self._title_head = array("I")
+        self._title_tail = array("I")
+
+    @classmethod
+    def from_grouped(cls, grouped, pool=None):
+        """Builds a table from a parsed {group: [record, ...]} JSON object."""
+        table = cls(pool)
+        for key, records in grouped.items():
+            # Keep groups without records, as json.dump() would
+            table._groups.setdefault(key, array("I"))
+            for record in records:
+                table.append_record(key, record)
+        return table
+
+    def append(self, key, fips, county_name, fred_id, units, full_title):
+        """Adds one record to the group `key`."""
+        encode = self.pool.encode
+        head, tail = split_series_title(full_title)
+
+        rows = self._groups.get(key)
+        if rows is None:
+            rows = self._groups[key] = array("I")
+        rows.append(len(self._fips))
+
+        self._fips.append(encode(fips))
+        self._county.append(encode(county_name))
+        self._fred_id.append(encode(fred_id))
+        self._units.append(encode(units))
+        self._title_head.append(encode(head))
+        self._title_tail.append(encode(tail))
+
+    def append_record(self, key, record):
+        """Adds a record dict with exactly the RECORD_FIELDS keys to the group `key`."""
+        if len(record) != len(RECORD_FIELDS) or any(field not in record for field in RECORD_FIELDS):
+            raise ValueError(f"Unexpected record fields {sorted(record)}; expected {list(RECORD_FIELDS)}")
+        self.append(key, *(record[field] for field in RECORD_FIELDS))
+
+    # --- Access ---
+
+    def __len__(self):
+        """Number of groups, matching len() of the dict this table replaces."""
+        return len(self._groups)
+
+    def __contains__(self, key):
+        return key in self._groups
+
+    def keys(self):
+        return self._groups.keys()
+
+    @property
+    def row_count(self):
+        return len(self._fips)
+
+    def record(self, row):
+        """Decodes one row back into a record dict."""
+        decode = self.pool.decode
+        head = decode(self._title_head[row])
+        tail = decode(self._title_tail[row])
+        return {
+            "FIPS": decode(self._fips[row]),
+            "County_Name": decode(self._county[row]),
+            "FRED_ID": decode(self._fred_id[row]),
+            "Units": decode(self._units[row]),
+            "Full_Series_Title": head if tail is None else head + tail,
+        }
+
+    def iter_records(self, key):
+        for row in self._groups[key]:
+            yield self.record(row)
+
+    def items(self):
+        for key in self._groups:
+            yield key, self.iter_records(key)
+
+    def to_dict(self):
+        """Expands the table into plain {group: [record, ...]} form."""
+        return {key: list(records) for key, records in self.items()}
+
+    # --- JSON output ---
+
+    def write_json(self, f, indent=4, sort_keys=False, level=0):
+        """
+        Streams the table to f exactly as json.dump(self.to_dict(), f,
+        indent=indent, sort_keys=sort_keys) would, one record at a time.
+        """
+        if not self._groups:
+            f.write("{}")
+            return
+
+        pad = " " * (indent * (level + 1))
+        record_pad = " " * (indent * (level + 2))
+        keys = sorted(self._groups) if sort_keys else self._groups
+
+        f.write("{")
+        for i, key in enumerate(keys):
+            if not self._groups[key]:
+                f.write(("," if i else "") + "\n" + pad + json.dumps(key) + ": []")
+                continue
+            f.write(("," if i else "") + "\n" + pad + json.dumps(key) + ": [")
+            for j, record in enumerate(self.iter_records(key)):
+                text = json.dumps(record, indent=indent, sort_keys=sort_keys)
+                f.write(("," if j else "") + "\n" + record_pad + text.replace("\n", "\n" + record_pad))
+            f.write("\n" + pad + "]")
+        f.write("\n" + " " * (indent * level) + "}")
+
+
+def write_tables_json(tables, f, indent=4, sort_keys=False):
+    """
+    Streams a {key: SeriesRecordTable} mapping (e.g. the master file's
+    {state: table}) to f exactly as json.dump() would write the nested dicts.
+    """
+    if not tables:
+        f.write("{}")
+        return
+
+    pad = " " * indent
+    keys = sorted(tables) if sort_keys else tables
+
+    f.write("{")
+    for i, key in enumerate(keys):
+        f.write(("," if i else "") + "\n" + pad + json.dumps(key) + ": ")
+        tables[key].write_json(f, indent=indent, sort_keys=sort_keys, level=1)
+    f.write("\n}")
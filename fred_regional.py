@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import sys
+
+import requests
+
+from fred_fetch_all import FRED_API_KEY
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GEOFRED_API_BASE_URL = 'https://api.stlouisfed.org/geofred'
+DEFAULT_REGION_TYPE = 'county'
+
+
+def _geofred_get(endpoint, params):
+    params = dict(params, api_key=FRED_API_KEY, file_type='json')
+    response = requests.get(f"{GEOFRED_API_BASE_URL}/{endpoint}", params=params, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+def fetch_series_group(fred_id):
+    """
+    Looks up the regional series group of a county series. Returns a dict
+    with 'series_group', 'region_type', 'units', 'frequency', 'season',
+    'min_date' and 'max_date'.
+    """
+    groups = _geofred_get('series/group', {'series_id': fred_id}).get('series_group')
+    if not groups:
+        raise ValueError(f"{fred_id} has no regional series group")
+    # The API returns a single group, as a dict or a one-item list
+    return groups[0] if isinstance(groups, list) else groups
+
+def fetch_cross_section(series_group, date, units, frequency, season='NSA', region_type=DEFAULT_REGION_TYPE):
+    """
+    Fetches one value per region for one date with a single regional data
+    request. Returns (meta, values) where values is {FIPS: float} keyed by
+    5-digit county FIPS (2-digit for states); regions without a value are
+    left out.
+    """
+    payload = _geofred_get('regional/data', {
+        'series_group': series_group,
+        'region_type': region_type,
+        'date': date,
+        'units': units,
+        'frequency': frequency,
+        'season': season,
+    })
+    meta = payload.get('meta', payload)
+    data = meta.get('data') or payload.get('data') or {}
+    code_width = 5 if region_type == 'county' else 2
+
+    values = {}
+    for rows in data.values():
+        for row in rows:
+            value = row.get('value')
+            if value in (None, '', '.'):
+                continue
+            values[str(row['code']).zfill(code_width)] = float(value)
+
+    meta = {key: value for key, value in meta.items() if key != 'data'}
+    return meta, values
+
+def cross_section_for_series(fred_id, date=None, region_type=DEFAULT_REGION_TYPE):
+    """
+    Cross-section of every county for the family of one county series
+    (e.g. any county's unemployment rate), on `date` or the latest date
+    available. Costs two requests: the group lookup and the data.
+    """
+    group = fetch_series_group(fred_id)
+    meta, values = fetch_cross_section(
+        group['series_group'],
+        date or group['max_date'],
+        units=group['units'],
+        frequency=group['frequency'],
+        season=group.get('season', 'NSA'),
+        region_type=region_type,
+    )
+    meta.setdefault('date', date or group['max_date'])
+    return meta, values
+
+def draw_cross_section(meta, values, output_html=None):
+    """Draws a {FIPS: value} cross-section with fred_vis."""
+    import fred_vis
+
+    counties = fred_vis.load_county_geojson()
+    df = fred_vis.county_values_frame(values, counties)
+    title = f"{meta.get('title', 'County values')} ({meta.get('date', '')})"
+    fig = fred_vis.build_choropleth(df, counties, title=title, label=meta.get('units', 'Value'))
+    if output_html:
+        fig.write_html(output_html)
+        print(f"Map saved to: {output_html}")
+    else:
+        fig.show()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fetch every county's value for one date with one GeoFRED request and map it.")
+    parser.add_argument('fred_id', help="any county series of the family (e.g. its FRED_ID from the master file)")
+    parser.add_argument('--date', help="observation date YYYY-MM-DD (default: latest)")
+    parser.add_argument('--output', help="save the {FIPS: value} cross-section to this JSON file")
+    parser.add_argument('--html', help="write the map to this HTML file instead of showing it")
+    parser.add_argument('--no-map', action='store_true', help="skip drawing the map")
+    args = parser.parse_args(argv)
+
+    if FRED_API_KEY == 'YOUR_FRED_API_KEY':
+        print("!!! ERROR: Please replace 'YOUR_FRED_API_KEY' with your actual FRED API key. !!!")
+        return 1
+
+    try:
+        meta, values = cross_section_for_series(args.fred_id, args.date)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        print(f"Error fetching the regional cross-section for {args.fred_id}: {e}")
+        return 1
+    print(f"Fetched {len(values)} county values for {meta.get('title', args.fred_id)} ({meta.get('date')})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'values': values}, f, indent=4)
+        print(f"Cross-section saved to: {args.output}")
+    if not args.no_map:
+        draw_cross_section(meta, values, args.html)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
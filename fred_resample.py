@@ -0,0 +1,235 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from fred_cube import FIPS_MAP_FILE, PERIODS_PER_YEAR, county_axis, family_slug, period_label
+from fred_observations import OBSERVATIONS_DIR, load_series_observations, observations_path
+from fred_query import QueryIndex
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESAMPLED_DIR = os.path.join(BASE_DIR, 'fred_resampled')
+
+# How observations are combined into (or spread over) target periods:
+#   mean - average of the observations in a period; coarser values are repeated
+#   end  - last observation in a period; coarser values land on their last sub-period
+#   sum  - total of the observations in a period; coarser values are split evenly
+AGGREGATIONS = ('mean', 'end', 'sum')
+
+# Source frequencies from finest to coarsest. When a county has series of
+# the same family at several frequencies, the finest one wins.
+SOURCE_FREQUENCIES = ('D', 'W', 'M', 'Q', 'A')
+
+# Aligned families already loaded in this process: cache path -> AlignedFamily
+_loaded = {}
+
+
+class AlignedFamily:
+    """
+    A series family aligned to one frequency: values and mask are
+    (counties x periods) arrays with rows in FIPS order.
+    """
+
+    def __init__(self, family, frequency, how, fips, start_period, values, mask, key):
+        self.family = family
+        self.frequency = frequency
+        self.how = how
+        self.fips = list(fips)
+        self.start_period = start_period
+        self.values = values
+        self.mask = mask
+        self.key = key
+
+    @property
+    def periods(self):
+        return [period_label(self.start_period + j, self.frequency) for j in range(self.values.shape[1])]
+
+
+# --- Resampling ---
+
+def _downsample(rows, periods, values, n_rows, n_periods, how):
+    """Aggregates observations into target periods with one bincount per statistic."""
+    cells = rows * n_periods + periods
+    size = n_rows * n_periods
+    if how == 'end':
+        # Observations arrive in date order, so the last one per cell wins
+        last_cells, reversed_pos = np.unique(cells[::-1], return_index=True)
+        out = np.full(size, np.nan)
+        out[last_cells] = values[::-1][reversed_pos]
+        return out.reshape(n_rows, n_periods)
+
+    counts = np.bincount(cells, minlength=size)
+    sums = np.bincount(cells, weights=values, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = sums / counts if how == 'mean' else np.where(counts > 0, sums, np.nan)
+    return out.reshape(n_rows, n_periods)
+
+def _upsample(rows, periods, values, n_rows, n_periods, how, ratio):
+    """Spreads each coarse observation over its `ratio` target sub-periods."""
+    out = np.full((n_rows, n_periods), np.nan)
+    if how == 'end':
+        out[rows, periods * ratio + ratio - 1] = values
+        return out
+    sub = np.arange(ratio)
+    target_rows = np.repeat(rows, ratio)
+    target_periods = (periods[:, None] * ratio + sub).ravel()
+    spread = np.repeat(values / ratio if how == 'sum' else values, ratio)
+    out[target_rows, target_periods] = spread
+    return out
+
+def align_family(family, frequency='A', how='mean', index=None, observations_dir=OBSERVATIONS_DIR,
+                 fips_map_file=FIPS_MAP_FILE):
+    """
+    Aligns every stored series of a family onto `frequency` ('A', 'Q' or 'M').
+
+    Observations are grouped by source frequency and each group is resampled
+    with a few array operations over all its series at once: bincount
+    for mean/sum, a unique-last pass for end of period, and repeat for
+    coarser sources. Returns an AlignedFamily (not cached; see aligned()).
+    """
+    if frequency not in PERIODS_PER_YEAR:
+        raise ValueError(f"Target frequency must be one of {', '.join(PERIODS_PER_YEAR)}")
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{how}'. Choose from {', '.join(AGGREGATIONS)}")
+
+    index = index or QueryIndex.open()
+    fips, _ = county_axis(fips_map_file)
+    row_of = {code: i for i, code in enumerate(fips)}
+
+    # 1. Gather each source frequency's stored columns (loading the files is
+    # the only per-series step)
+    groups = {}
+    for fred_id in index.series_for_title(family):
+        county = index.series[fred_id][0]
+        if county not in row_of:
+            continue
+        series = load_series_observations(fred_id, observations_dir)
+        if not series or not series['dates']:
+            continue
+        group = groups.setdefault(series['frequency'], ([], [], [], []))
+        group[0].append(row_of[county])
+        group[1].append(len(series['dates']))
+        group[2].extend(series['dates'])
+        group[3].extend(series['values'])
+
+    # 2. Convert each group to arrays in one pass and map every observation to
+    # its target period (or its own, for coarser sources)
+    target_n = PERIODS_PER_YEAR[frequency]
+    prepared = []
+    for source in SOURCE_FREQUENCIES[::-1]:
+        if source not in groups:
+            continue
+        series_rows, lengths, dates, values = groups[source]
+        rows = np.repeat(np.array(series_rows, dtype=np.int64), lengths)
+        months = np.array(dates, dtype='datetime64[M]').astype(np.int64) + 1970 * 12
+        # Missing observations (None) become NaN and are dropped here
+        values = np.array(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        rows, months, values = rows[present], months[present], values[present]
+        if not len(values):
+            continue
+        coarser = source in PERIODS_PER_YEAR and PERIODS_PER_YEAR[source] < target_n
+        if coarser:
+            if target_n % PERIODS_PER_YEAR[source]:
+                print(f"  ! {family}: cannot spread {source} observations evenly over {frequency}; skipped")
+                continue
+            ratio = target_n // PERIODS_PER_YEAR[source]
+            periods = months * PERIODS_PER_YEAR[source] // 12
+            first, last = periods.min() * ratio, periods.max() * ratio + ratio - 1
+        else:
+            ratio = None
+            periods = months * target_n // 12
+            first, last = periods.min(), periods.max()
+        prepared.append((rows, periods, values, ratio, first, last))
+
+    if not prepared:
+        return AlignedFamily(family, frequency, how, fips, 0,
+                             np.empty((len(fips), 0)), np.zeros((len(fips), 0), dtype=bool), None)
+
+    start = int(min(p[4] for p in prepared))
+    n_periods = int(max(p[5] for p in prepared)) - start + 1
+
+    # 3. Resample each group and overlay them from coarsest to finest
+    out = np.full((len(fips), n_periods), np.nan)
+    for rows, periods, values, ratio, _, _ in prepared:
+        if ratio:
+            block = _upsample(rows, periods - start // ratio, values, len(fips), n_periods + ratio, how, ratio)
+            block = block[:, start % ratio:start % ratio + n_periods]
+        else:
+            block = _downsample(rows, periods - start, values, len(fips), n_periods, how)
+        has_value = ~np.isnan(block)
+        out[has_value] = block[has_value]
+
+    return AlignedFamily(family, frequency, how, fips, start, out, ~np.isnan(out), None)
+
+
+# --- Cache ---
+
+def _inputs_key(family, frequency, how, index, observations_dir, fips_map_file):
+    """Hash of the parameters and the size/mtime of every input file."""
+    h = hashlib.sha256(json.dumps([family, frequency, how]).encode('utf-8'))
+    st = os.stat(fips_map_file)
+    h.update(f"{st.st_size}:{st.st_mtime_ns};".encode())
+    for fred_id in sorted(index.series_for_title(family)):
+        path = observations_path(fred_id, observations_dir)
+        if os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{fred_id}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+def aligned_path(family, frequency, how, resampled_dir=RESAMPLED_DIR):
+    return os.path.join(resampled_dir, f"{family_slug(family)}__{frequency}__{how}.npz")
+
+def aligned(family, frequency='A', how='mean', index=None, observations_dir=OBSERVATIONS_DIR,
+            resampled_dir=RESAMPLED_DIR, fips_map_file=FIPS_MAP_FILE):
+    """
+    Cached align_family(). The result is reused (from memory, then from
+    fred_resampled/) until a series of the family or the county list
+    changes on disk.
+    """
+    index = index or QueryIndex.open()
+    key = _inputs_key(family, frequency, how, index, observations_dir, fips_map_file)
+    path = aligned_path(family, frequency, how, resampled_dir)
+
+    result = _loaded.get(path)
+    if result is None and os.path.exists(path):
+        with np.load(path, allow_pickle=False) as data:
+            result = AlignedFamily(family, frequency, how, data['fips'].tolist(), int(data['start_period']),
+                                   data['values'], data['mask'], str(data['key']))
+    if result is not None and result.key == key:
+        _loaded[path] = result
+        return result
+
+    result = align_family(family, frequency, how, index, observations_dir, fips_map_file)
+    result.key = key
+    os.makedirs(resampled_dir, exist_ok=True)
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, key=np.array(key), fips=np.array(result.fips), start_period=np.array(result.start_period),
+             values=result.values, mask=result.mask)
+    os.replace(tmp_path, path)
+    _loaded[path] = result
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Align a series family onto one frequency.")
+    parser.add_argument('family')
+    parser.add_argument('--frequency', default='A', choices=sorted(PERIODS_PER_YEAR))
+    parser.add_argument('--how', default='mean', choices=AGGREGATIONS)
+    args = parser.parse_args(argv)
+
+    result = aligned(args.family, args.frequency, args.how)
+    counties = int(result.mask.any(axis=1).sum())
+    if not result.values.shape[1]:
+        print(f"No stored observations for {args.family}")
+    else:
+        print(f"{args.family}: {counties} counties x {result.values.shape[1]} periods "
+              f"({result.periods[0]} .. {result.periods[-1]}, {args.frequency}, {args.how})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from fred_cube import CUBES_DIR, family_slug, open_cube, period_index, period_label
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROLLUPS_DIR = os.path.join(BASE_DIR, 'fred_rollups')
+
+AGGREGATIONS = ('sum', 'mean', 'median', 'weighted_mean')
+
+# Weight names accepted by rollup() -> the county series family used as weights
+WEIGHT_FAMILIES = {
+    'population': 'Resident Population',
+    'labor_force': 'Civilian Labor Force',
+}
+
+# Views precomputed by the 'rollups' pipeline stage: (family, aggregation, weight)
+ROLLUP_VIEWS = [
+    ('Unemployment Rate', 'mean', None),
+    ('Unemployment Rate', 'median', None),
+    ('Unemployment Rate', 'weighted_mean', 'labor_force'),
+    ('Civilian Labor Force', 'sum', None),
+    ('Resident Population', 'sum', None),
+    ('Per Capita Personal Income', 'median', None),
+    ('Per Capita Personal Income', 'weighted_mean', 'population'),
+]
+
+# Rollups already loaded in this process: cache path -> Rollup
+_loaded = {}
+
+
+class Rollup:
+    """
+    State and national aggregates of one series family, aligned to the
+    family cube's periods. state_values is (states x periods); counts give
+    the number of counties that contributed to each value.
+    """
+
+    def __init__(self, family, how, weight, frequency, start_period, states,
+                 state_values, state_counts, national, national_counts, tokens):
+        self.family = family
+        self.how = how
+        self.weight = weight
+        self.frequency = frequency
+        self.start_period = start_period
+        self.states = list(states)
+        self.state_values = state_values
+        self.state_counts = state_counts
+        self.national = national
+        self.national_counts = national_counts
+        self.tokens = tokens
+
+    @property
+    def periods(self):
+        return [period_label(self.start_period + j, self.frequency) for j in range(self.national.shape[0])]
+
+    def state(self, state_abbr):
+        """Aggregate of one state across all periods."""
+        return self.state_values[self.states.index(state_abbr)]
+
+    def at(self, date_str):
+        """{state: value} plus 'US' for the period containing date_str."""
+        j = period_index(date_str, self.frequency) - self.start_period
+        if not 0 <= j < self.national.shape[0]:
+            raise KeyError(f"{date_str} is outside the {self.family} rollup")
+        result = {state: float(self.state_values[i, j]) for i, state in enumerate(self.states)}
+        result['US'] = float(self.national[j])
+        return result
+
+
+# --- Aggregation ---
+
+def _aligned_weights(cube, weights_cube):
+    """
+    Returns (weights, mask) from weights_cube on cube's period axis. Each
+    period takes the weight of the weights period containing it, clamped to
+    the weights' first/last period (e.g. monthly rates weighted by the
+    latest annual population estimate).
+    """
+    if weights_cube.fips != cube.fips:
+        raise ValueError(f"{cube.family} and {weights_cube.family} cubes use different county axes; rebuild them")
+    labels = [period_label(cube.start_period + j, cube.frequency) for j in range(cube.n_periods)]
+    columns = np.array([period_index(label, weights_cube.frequency) for label in labels]) - weights_cube.start_period
+    columns = np.clip(columns, 0, weights_cube.n_periods - 1)
+    return weights_cube.values[:, columns], weights_cube.mask[:, columns]
+
+def aggregate(cube, how, weights_cube=None):
+    """
+    Aggregates a cube from counties to states and the nation. Every
+    aggregation except median is one reduceat over the contiguous state row
+    ranges; median is one nanmedian per state.
+    Returns (states, state_values, state_counts, national, national_counts).
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{how}'. Choose from {', '.join(AGGREGATIONS)}")
+    if how == 'weighted_mean' and weights_cube is None:
+        raise ValueError("weighted_mean needs a weights cube")
+
+    states = sorted(cube.state_rows, key=lambda s: cube.state_rows[s][0])
+    starts = np.array([cube.state_rows[s][0] for s in states])
+    values = np.asarray(cube.values, dtype=np.float64)
+    mask = np.asarray(cube.mask)
+
+    if how == 'weighted_mean':
+        weights, weights_mask = _aligned_weights(cube, weights_cube)
+        mask = mask & weights_mask
+        weights = np.where(mask, weights, 0.0).astype(np.float64)
+
+    counts = np.add.reduceat(mask.astype(np.int64), starts, axis=0)
+    national_counts = counts.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if how == 'median':
+            masked = np.where(mask, values, np.nan)
+            state_values = np.full(counts.shape, np.nan)
+            for i, state in enumerate(states):
+                first, end = cube.state_rows[state]
+                block = masked[first:end]
+                has_data = counts[i] > 0
+                if has_data.any():
+                    state_values[i, has_data] = np.nanmedian(block[:, has_data], axis=0)
+            national = np.full(national_counts.shape, np.nan)
+            has_data = national_counts > 0
+            if has_data.any():
+                national[has_data] = np.nanmedian(masked[:, has_data], axis=0)
+        elif how == 'weighted_mean':
+            products = np.where(mask, values * weights, 0.0)
+            numerators = np.add.reduceat(products, starts, axis=0)
+            denominators = np.add.reduceat(weights, starts, axis=0)
+            state_values = numerators / denominators
+            national = numerators.sum(axis=0) / denominators.sum(axis=0)
+        else:
+            sums = np.add.reduceat(np.where(mask, values, 0.0), starts, axis=0)
+            national_sums = sums.sum(axis=0)
+            if how == 'sum':
+                state_values = np.where(counts > 0, sums, np.nan)
+                national = np.where(national_counts > 0, national_sums, np.nan)
+            else:
+                state_values = sums / counts
+                national = national_sums / national_counts
+
+    return states, state_values, counts, national, national_counts
+
+
+# --- Materialized views ---
+
+def rollup_path(family, how, weight=None, rollups_dir=ROLLUPS_DIR):
+    name = f"{family_slug(family)}__{how}" + (f"__{weight}" if weight else "") + ".npz"
+    return os.path.join(rollups_dir, name)
+
+def _load_view(path):
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        return Rollup(meta['family'], meta['how'], meta['weight'], meta['frequency'], meta['start_period'],
+                      data['states'].tolist(), data['state_values'], data['state_counts'],
+                      data['national'], data['national_counts'], meta['tokens'])
+
+def _save_view(path, view):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta = {
+        'family': view.family,
+        'how': view.how,
+        'weight': view.weight,
+        'frequency': view.frequency,
+        'start_period': view.start_period,
+        'tokens': view.tokens,
+    }
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, meta=np.array(json.dumps(meta)), states=np.array(view.states),
+             state_values=view.state_values, state_counts=view.state_counts,
+             national=view.national, national_counts=view.national_counts)
+    os.replace(tmp_path, path)
+
+def rollup(family, how='mean', weight=None, cubes_dir=CUBES_DIR, rollups_dir=ROLLUPS_DIR):
+    """
+    Returns the Rollup of a family, from the in-process cache, the
+    materialized view on disk, or by aggregating the cube. A cached view is
+    used only while the tokens of the cubes it was computed from are
+    unchanged, so it is recomputed exactly when the county data changes.
+    """
+    if weight is not None and weight not in WEIGHT_FAMILIES:
+        raise ValueError(f"Unknown weight '{weight}'. Choose from {', '.join(WEIGHT_FAMILIES)}")
+    if how == 'weighted_mean' and weight is None:
+        raise ValueError("weighted_mean needs a weight (e.g. weight='population')")
+
+    cube = open_cube(family, cubes_dir)
+    weights_cube = open_cube(WEIGHT_FAMILIES[weight], cubes_dir) if weight else None
+    tokens = [cube.token] + ([weights_cube.token] if weights_cube else [])
+
+    path = rollup_path(family, how, weight, rollups_dir)
+    view = _loaded.get(path)
+    if view is None and os.path.exists(path):
+        view = _load_view(path)
+    if view is not None and view.tokens == tokens:
+        _loaded[path] = view
+        return view
+
+    states, state_values, state_counts, national, national_counts = aggregate(cube, how, weights_cube)
+    view = Rollup(family, how, weight, cube.frequency, cube.start_period, states,
+                  state_values, state_counts, national, national_counts, tokens)
+    _save_view(path, view)
+    _loaded[path] = view
+    return view
+
+def build_rollups(views=None, cubes_dir=CUBES_DIR, rollups_dir=ROLLUPS_DIR):
+    """Refreshes the configured materialized views (pipeline stage)."""
+    print(f"Refreshing rollups in {rollups_dir}...")
+    for family, how, weight in views or ROLLUP_VIEWS:
+        label = f"{family} / {how}" + (f" by {weight}" if weight else "")
+        try:
+            view = rollup(family, how, weight, cubes_dir, rollups_dir)
+        except FileNotFoundError as e:
+            print(f"  ! Skipped {label}: missing cube ({e.filename})")
+            continue
+        print(f"  ✓ {label}: {len(view.states)} states x {view.national.shape[0]} periods")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="State and national rollups of county series cubes.")
+    parser.add_argument('family', nargs='?', help="series family (default: refresh every configured view)")
+    parser.add_argument('--how', default='mean', choices=AGGREGATIONS)
+    parser.add_argument('--weight', choices=sorted(WEIGHT_FAMILIES))
+    parser.add_argument('--date', help="print the values for the period containing this date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    if not args.family:
+        build_rollups()
+        return 0
+
+    view = rollup(args.family, args.how, args.weight)
+    if args.date:
+        print(json.dumps(view.at(args.date), indent=4))
+    else:
+        print(f"{view.family} / {view.how}: {len(view.states)} states, periods {view.periods[0]} .. {view.periods[-1]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# --- Configuration ---
+
+# Prior for the latency of one request before any has been timed:
+# seconds = PRIOR_BASE_SECONDS + PRIOR_ITEM_SECONDS * items
+PRIOR_BASE_SECONDS = 0.5
+PRIOR_ITEM_SECONDS = 0.001
+# The prior counts as this many observations, so the first few real
+# timings move the estimate without swinging it
+PRIOR_WEIGHT = 4.0
+# Observations lose half their weight after this many newer ones
+LATENCY_HALFLIFE = 50
+# Minimum seconds between progress lines
+REPORT_INTERVAL = 5.0
+
+# A unit of work: `items` is its expected size (e.g. series on a FRED page),
+# `payload` is passed to the run function
+Task = namedtuple('Task', 'key items payload')
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
+class LatencyModel:
+    """
+    Online estimate of request latency as base + per_item * items: an
+    exponentially weighted least-squares fit, so it follows the API as it
+    speeds up or slows down during a run.
+    """
+
+    def __init__(self, base=PRIOR_BASE_SECONDS, per_item=PRIOR_ITEM_SECONDS,
+                 prior_weight=PRIOR_WEIGHT, halflife=LATENCY_HALFLIFE):
+        self.decay = 0.5 ** (1.0 / halflife)
+        self._lock = threading.Lock()
+        # Weighted sums of 1, x, y, x*x, x*y; seeded with two prior points
+        self._sums = [0.0] * 5
+        for items in (0, 1000):
+            self._add(items, base + per_item * items, prior_weight / 2)
+
+    def _add(self, items, seconds, weight):
+        s = self._sums
+        s[0] += weight
+        s[1] += weight * items
+        s[2] += weight * seconds
+        s[3] += weight * items * items
+        s[4] += weight * items * seconds
+
+    def observe(self, items, seconds):
+        with self._lock:
+            self._sums = [value * self.decay for value in self._sums]
+            self._add(items, seconds, 1.0)
+
+    def coefficients(self):
+        """Returns (base, per_item) of the current fit."""
+        with self._lock:
+            w, x, y, xx, xy = self._sums
+        variance = w * xx - x * x
+        per_item = max((w * xy - x * y) / variance, 0.0) if variance > 0 else 0.0
+        base = max((y - per_item * x) / w, 0.0)
+        return base, per_item
+
+    def estimate(self, items):
+        base, per_item = self.coefficients()
+        return base + per_item * items
+
+
+class RateLimiter:
+    """Spaces the start of successive requests, across threads, at least `interval` seconds apart."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def run_largest_first(tasks, run_task, on_done=None, workers=4, model=None, min_interval=0.0, label='tasks'):
+    """
+    Runs tasks on a thread pool, always starting the largest estimated task
+    next so that long tasks do not end up alone at the end of the run.
+
+    run_task(payload) runs in a worker and returns (items, result), where
+    items is the size actually processed (used to refine the latency model).
+    on_done(task, result) runs on the calling thread and may return new
+    tasks, which join the queue by size (e.g. pages found to be missing).
+    Only `workers` tasks are in flight at a time, so later, larger tasks
+    still go ahead of smaller queued ones.
+
+    Prints progress with an ETA from the latency model and the rate limit.
+    Returns the LatencyModel.
+    """
+    model = model or LatencyModel()
+    limiter = RateLimiter(min_interval)
+    order = itertools.count()
+    queue = []
+
+    def push(task):
+        heapq.heappush(queue, (-task.items, next(order), task))
+
+    for task in tasks:
+        push(task)
+
+    def timed(task):
+        limiter.wait()
+        started = time.perf_counter()
+        items, result = run_task(task.payload)
+        elapsed = time.perf_counter() - started
+        model.observe(items, elapsed)
+        return result, elapsed
+
+    total = len(queue)
+    done = 0
+    run_started = time.perf_counter()
+    last_report = 0.0
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while queue or in_flight:
+            while queue and len(in_flight) < workers:
+                _, _, task = heapq.heappop(queue)
+                in_flight[pool.submit(timed, task)] = (task, time.perf_counter())
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task, _ = in_flight.pop(future)
+                result, _ = future.result()
+                done += 1
+                for new_task in (on_done(task, result) if on_done else None) or []:
+                    push(new_task)
+                    total += 1
+
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL or not (queue or in_flight):
+                last_report = now
+                eta = estimate_remaining(queue, in_flight, model, workers, min_interval, now)
+                print(f"  ... {done}/{total} {label} done in {format_duration(now - run_started)}, "
+                      f"ETA {format_duration(eta)}")
+    return model
+
+def estimate_remaining(queue, in_flight, model, workers, min_interval, now=None):
+    """
+    Seconds left: the estimated work queued and still in flight spread over
+    the workers, but never less than the rate limit allows.
+    """
+    now = time.perf_counter() if now is None else now
+    queued = sum(model.estimate(task.items) for _, _, task in queue)
+    running = sum(max(model.estimate(task.items) - (now - started), 0.0) for task, started in in_flight.values())
+    return max((queued + running) / max(workers, 1), len(queue) * min_interval)
@@ -0,0 +1,363 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from fred_query import INDEX_FILE, MASTER_FILE, QueryIndex, _source_signature
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEARCH_DIR = os.path.join(BASE_DIR, 'fred_search_index')
+SEARCH_FORMAT_VERSION = 1
+
+# Weight of a token by the field it was found in (the best field counts)
+FIELD_WEIGHTS = {
+    'County_Name': 1.5,
+    'State': 1.0,
+    'Series_Title': 1.0,
+    'Full_Series_Title': 1.0,
+    'Units': 0.5,
+}
+# Positions of those fields in a QueryIndex 'series' row
+FIELD_COLUMNS = {'County_Name': 1, 'State': 2, 'Units': 3, 'Series_Title': 4, 'Full_Series_Title': 5}
+
+# Query terms are matched exactly, then as a prefix, then by trigram similarity
+PREFIX_WEIGHT = 0.8
+PREFIX_MAX_TERMS = 50
+FUZZY_WEIGHT = 0.6
+FUZZY_MIN_SIMILARITY = 0.5
+FUZZY_MAX_TERMS = 5
+
+# Index files kept in fred_search_index/ (each .npy is memory-mapped on load)
+ARRAYS = ('vocab', 'term_offsets', 'term_docs', 'term_weights', 'trigrams', 'trigram_offsets',
+          'trigram_terms', 'fred_ids', 'doc_titles', 'doc_lengths', 'titles')
+
+# Search index loaded on first use by search()/suggest()
+_index = None
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens of a field value."""
+    if not text:
+        return []
+    return re.findall(r'[a-z0-9]+', str(text).lower())
+
+def trigrams(token):
+    """Character trigrams of a token padded with spaces ('rate' -> ' ra', 'rat', 'ate', 'te ')."""
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _csr(keys, n_keys):
+    """Groups entries by integer key: returns (offsets, entry order sorted by key)."""
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=offsets[1:])
+    return offsets, order
+
+
+class SearchIndex:
+    """
+    Token and trigram search over every series in the query index.
+
+    - vocab:       sorted distinct tokens of titles, units, county names and states
+    - term_*:      postings per token (CSR): series numbers and field weights
+    - trigram_*:   trigram -> tokens containing it, for typo-tolerant matching
+    - fred_ids:    series number -> FRED_ID; doc_titles -> normalized title number
+
+    Every array is a .npy file in fred_search_index/ and is memory-mapped by
+    load(), so opening the index costs almost nothing and a query only
+    touches the postings it needs.
+    """
+
+    def __init__(self, arrays, meta):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.idf = np.log1p(len(self.fred_ids) / np.maximum(np.diff(self.term_offsets), 1)).astype(np.float32)
+
+    @classmethod
+    def build(cls, index):
+        """Tokenizes every series of a QueryIndex once and builds the arrays."""
+        term_ids = {}
+        post_terms, post_docs, post_weights = [], [], []
+        fred_ids = list(index.series)
+        title_ids = {}
+        doc_titles = np.empty(len(fred_ids), dtype=np.int32)
+        doc_lengths = np.empty(len(fred_ids), dtype=np.float32)
+
+        for doc, fred_id in enumerate(fred_ids):
+            row = index.series[fred_id]
+            weights = {}
+            for field, column in FIELD_COLUMNS.items():
+                for token in tokenize(row[column]):
+                    if weights.get(token, 0) < FIELD_WEIGHTS[field]:
+                        weights[token] = FIELD_WEIGHTS[field]
+            for token, weight in weights.items():
+                post_terms.append(term_ids.setdefault(token, len(term_ids)))
+                post_docs.append(doc)
+                post_weights.append(weight)
+            doc_titles[doc] = title_ids.setdefault(row[4] or '', len(title_ids))
+            doc_lengths[doc] = len(weights)
+
+        # Renumber tokens in sorted order so prefixes are contiguous ranges
+        vocab = sorted(term_ids)
+        rank = np.empty(len(vocab), dtype=np.int64)
+        rank[[term_ids[token] for token in vocab]] = np.arange(len(vocab))
+        post_terms = rank[np.array(post_terms, dtype=np.int64)]
+        term_offsets, order = _csr(post_terms, len(vocab))
+
+        # Trigram -> tokens, over the vocabulary only
+        gram_ids = {}
+        gram_keys, gram_terms = [], []
+        for term, token in enumerate(vocab):
+            for gram in trigrams(token):
+                gram_keys.append(gram_ids.setdefault(gram, len(gram_ids)))
+                gram_terms.append(term)
+        grams = sorted(gram_ids)
+        gram_rank = np.empty(len(grams), dtype=np.int64)
+        gram_rank[[gram_ids[gram] for gram in grams]] = np.arange(len(grams))
+        gram_keys = gram_rank[np.array(gram_keys, dtype=np.int64)]
+        trigram_offsets, gram_order = _csr(gram_keys, len(grams))
+
+        arrays = {
+            'vocab': np.array(vocab, dtype=str),
+            'term_offsets': term_offsets,
+            'term_docs': np.array(post_docs, dtype=np.int32)[order],
+            'term_weights': np.array(post_weights, dtype=np.float32)[order],
+            'trigrams': np.array(grams, dtype=str),
+            'trigram_offsets': trigram_offsets,
+            'trigram_terms': np.array(gram_terms, dtype=np.int32)[gram_order],
+            'fred_ids': np.array(fred_ids, dtype=str),
+            'doc_titles': doc_titles,
+            'doc_lengths': doc_lengths,
+            'titles': np.array(sorted(title_ids, key=title_ids.get), dtype=str),
+        }
+        meta = {'format_version': SEARCH_FORMAT_VERSION, 'source': index.source}
+        return cls(arrays, meta)
+
+    def save(self, search_dir=SEARCH_DIR):
+        os.makedirs(search_dir, exist_ok=True)
+        for name in ARRAYS:
+            tmp_path = os.path.join(search_dir, f'{name}.tmp.npy')
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, os.path.join(search_dir, f'{name}.npy'))
+        # meta.json goes last: a half-written index is never mistaken for a current one
+        tmp_path = os.path.join(search_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=4)
+        os.replace(tmp_path, os.path.join(search_dir, 'meta.json'))
+
+    @classmethod
+    def load(cls, search_dir=SEARCH_DIR):
+        with open(os.path.join(search_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != SEARCH_FORMAT_VERSION:
+            raise ValueError(f"{search_dir} has an unsupported index format; rebuild it")
+        arrays = {name: np.load(os.path.join(search_dir, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        return cls(arrays, meta)
+
+    @classmethod
+    def open(cls, master_file=MASTER_FILE, index_file=INDEX_FILE, search_dir=SEARCH_DIR):
+        """
+        Loads the persisted search index, rebuilding it first if it is missing
+        or was built from a different version of the master file. The query
+        index is only read when a rebuild is needed.
+        """
+        try:
+            search_index = cls.load(search_dir)
+            source = search_index.meta['source']
+            if _source_signature(master_file, source)['sha256'] == source.get('sha256'):
+                return search_index
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        search_index = cls.build(QueryIndex.open(master_file, index_file))
+        search_index.save(search_dir)
+        return search_index
+
+    # --- Term matching ---
+
+    def _prefix_terms(self, token):
+        """Vocabulary numbers of the most frequent tokens starting with `token`."""
+        lo = int(np.searchsorted(self.vocab, token, 'left'))
+        hi = int(np.searchsorted(self.vocab, token + '~', 'left'))
+        terms = np.arange(lo, hi)
+        if len(terms) > PREFIX_MAX_TERMS:
+            df = self.term_offsets[terms + 1] - self.term_offsets[terms]
+            terms = terms[np.argsort(-df, kind='stable')[:PREFIX_MAX_TERMS]]
+        return terms
+
+    def _fuzzy_terms(self, token):
+        """
+        Vocabulary numbers and similarities of the tokens sharing the most
+        trigrams with `token` (Dice coefficient >= FUZZY_MIN_SIMILARITY).
+        """
+        grams = sorted(trigrams(token))
+        positions = np.searchsorted(self.trigrams, grams)
+        found = [p for p, gram in zip(positions, grams) if p < len(self.trigrams) and self.trigrams[p] == gram]
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        candidates = np.concatenate([self.trigram_terms[self.trigram_offsets[p]:self.trigram_offsets[p + 1]]
+                                     for p in found])
+        terms, shared = np.unique(candidates, return_counts=True)
+        # A padded token of n characters has n trigrams
+        lengths = np.char.str_len(self.vocab[terms])
+        similarity = (2.0 * shared / (len(grams) + lengths)).astype(np.float32)
+        keep = np.argsort(-similarity, kind='stable')[:FUZZY_MAX_TERMS]
+        keep = keep[similarity[keep] >= FUZZY_MIN_SIMILARITY]
+        return terms[keep], similarity[keep]
+
+    def expand(self, token, prefix=False):
+        """
+        Returns (vocabulary numbers, weights) matching one query token: the
+        exact token, plus its completions when `prefix` is set, or the
+        closest spellings when nothing else matches.
+        """
+        pos = int(np.searchsorted(self.vocab, token))
+        exact = pos < len(self.vocab) and self.vocab[pos] == token
+        terms = [np.array([pos] if exact else [], dtype=np.int64)]
+        weights = [np.ones(len(terms[0]), dtype=np.float32)]
+        if prefix:
+            completions = self._prefix_terms(token)
+            completions = completions[completions != pos] if exact else completions
+            terms.append(completions)
+            weights.append(np.full(len(completions), PREFIX_WEIGHT, dtype=np.float32))
+        if not sum(len(t) for t in terms):
+            fuzzy, similarity = self._fuzzy_terms(token)
+            terms.append(fuzzy)
+            weights.append(similarity * FUZZY_WEIGHT)
+        return np.concatenate(terms), np.concatenate(weights)
+
+    # --- Queries ---
+
+    def scores(self, query, prefix=True):
+        """
+        Scores every series against the query. Returns (doc numbers, scores)
+        of the series matching all query tokens (or, if none does, the most
+        tokens). With `prefix`, the last token also matches as a prefix, as
+        in an autocomplete box.
+        """
+        tokens = tokenize(query)
+        n_docs = len(self.fred_ids)
+        if not tokens:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        total = np.zeros(n_docs, dtype=np.float32)
+        matched = np.zeros(n_docs, dtype=np.int32)
+        for i, token in enumerate(tokens):
+            terms, weights = self.expand(token, prefix=prefix and i == len(tokens) - 1)
+            if not len(terms):
+                continue
+            starts, ends = self.term_offsets[terms], self.term_offsets[terms + 1]
+            docs = np.concatenate([self.term_docs[s:e] for s, e in zip(starts, ends)])
+            term_scores = np.repeat(weights * self.idf[terms], ends - starts)
+            posting_weights = np.concatenate([self.term_weights[s:e] for s, e in zip(starts, ends)])
+            token_scores = np.bincount(docs, weights=term_scores * posting_weights, minlength=n_docs)
+            total += token_scores
+            matched += token_scores > 0
+
+        best = matched.max()
+        if best == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        docs = np.flatnonzero(matched == best)
+        # Shorter series descriptions rank ahead of longer ones with the same terms
+        return docs, total[docs] / np.sqrt(self.doc_lengths[docs])
+
+    def search(self, query, limit=20, prefix=True):
+        """Returns up to `limit` (FRED_ID, score) pairs, best first."""
+        if limit <= 0:
+            return []
+        docs, scores = self.scores(query, prefix)
+        if len(docs) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            docs, scores = docs[top], scores[top]
+        order = np.lexsort((docs, -scores))
+        return [(str(self.fred_ids[d]), round(float(s), 4)) for d, s in zip(docs[order], scores[order])]
+
+    def suggest(self, query, limit=10, prefix=True):
+        """
+        Autocomplete over series titles: returns up to `limit`
+        {'title', 'series', 'score'} dicts, where 'series' counts the
+        matching county series with that title.
+        """
+        docs, scores = self.scores(query, prefix)
+        if not len(docs) or limit <= 0:
+            return []
+        titles = self.doc_titles[docs]
+        best = np.zeros(len(self.titles), dtype=np.float32)
+        np.maximum.at(best, titles, scores)
+        counts = np.bincount(titles, minlength=len(self.titles))
+        found = np.flatnonzero(counts)
+        ranked = found[np.lexsort((-counts[found], -best[found]))[:limit]]
+        return [{'title': str(self.titles[t]), 'series': int(counts[t]), 'score': round(float(best[t]), 4)}
+                for t in ranked]
+
+
+def get_search_index():
+    """The process-wide SearchIndex, opened on first use."""
+    global _index
+    if _index is None:
+        _index = SearchIndex.open()
+    return _index
+
+def search(query, limit=20, prefix=True):
+    return get_search_index().search(query, limit, prefix)
+
+def suggest(query, limit=10, prefix=True):
+    return get_search_index().suggest(query, limit, prefix)
+
+
+# --- Build stage ---
+
+def build_search_index(master_file=MASTER_FILE, index_file=INDEX_FILE, search_dir=SEARCH_DIR):
+    """Builds the search index from the query index and saves it (pipeline stage)."""
+    started = time.perf_counter()
+    search_index = SearchIndex.build(QueryIndex.open(master_file, index_file))
+    search_index.save(search_dir)
+    print(f"✅ Indexed {len(search_index.fred_ids)} series, {len(search_index.vocab)} tokens and "
+          f"{len(search_index.trigrams)} trigrams in {time.perf_counter() - started:.1f}s")
+    print(f"Search index saved to: {search_dir}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search county series by title, units or county name.")
+    parser.add_argument('query', nargs='?', help="search text (omit with --build)")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--titles', action='store_true', help="suggest series titles instead of series")
+    parser.add_argument('--exact', action='store_true', help="do not match the last word as a prefix")
+    parser.add_argument('--build', action='store_true', help="rebuild and save the index")
+    args = parser.parse_args(argv)
+
+    if args.build:
+        build_search_index()
+        if not args.query:
+            return 0
+    if not args.query:
+        parser.error("a query is required")
+
+    search_index = get_search_index()
+    started = time.perf_counter()
+    if args.titles:
+        results = search_index.suggest(args.query, args.limit, prefix=not args.exact)
+    else:
+        results = search_index.search(args.query, args.limit, prefix=not args.exact)
+    elapsed = (time.perf_counter() - started) * 1000
+
+    index = None if args.titles else QueryIndex.open()
+    for result in results:
+        if args.titles:
+            print(f"{result['score']:8.3f}  {result['title']}  ({result['series']} series)")
+        else:
+            fred_id, score = result
+            info = index.series_info(fred_id)
+            print(f"{score:8.3f}  {fred_id:<16} {info['Full_Series_Title']}")
+    print(f"{len(results)} results in {elapsed:.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
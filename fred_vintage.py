@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import sys
+import time
+from bisect import bisect_right
+from datetime import date, timedelta
+
+import numpy as np
+
+from fred_fetch_all import FRED_API_BASE_URL, FRED_API_KEY, fred_api_get
+from fred_observations import OBSERVATIONS_DIR, SERIES_QUERY_DELAY
+
+# --- Configuration ---
+
+VINTAGES_DIR = os.path.join(OBSERVATIONS_DIR, 'vintages')
+
+# ALFRED's full real-time range: every vintage of every observation
+REALTIME_START = '1776-07-04'
+REALTIME_END = '9999-12-31'
+
+# Maximum rows per ALFRED observations request
+ALFRED_PAGE_LIMIT = 100000
+
+
+# --- Download ---
+
+def fetch_realtime_observations(fred_id):
+    """
+    Downloads every vintage of a series from ALFRED. Returns a list of
+    (date, value, realtime_start, realtime_end) rows. Each row is one value
+    of one observation date and the range of vintages in which it was
+    current, so the row count grows with revisions, not with
+    vintages x series length.
+    """
+    rows = []
+    offset = 0
+    while True:
+        if offset:
+            time.sleep(SERIES_QUERY_DELAY)
+        params = {
+            'series_id': fred_id,
+            'api_key': FRED_API_KEY,
+            'file_type': 'json',
+            'realtime_start': REALTIME_START,
+            'realtime_end': REALTIME_END,
+            'limit': ALFRED_PAGE_LIMIT,
+            'offset': offset,
+        }
+        payload = fred_api_get(f"{FRED_API_BASE_URL}/series/observations", params, timeout=120)
+        page = payload.get('observations', [])
+        for obs in page:
+            value = None if obs['value'] == '.' else float(obs['value'])
+            rows.append((obs['date'], value, obs['realtime_start'], obs['realtime_end']))
+        offset += len(page)
+        if not page or offset >= payload.get('count', 0):
+            return rows
+
+
+# --- Delta encoding ---
+
+def encode_revision_deltas(fred_id, rows):
+    """
+    Encodes realtime rows as deltas against the previous vintage.
+
+    Returns a columnar dict: 'vintages' (sorted vintage dates), 'dates'
+    (sorted observation dates) and one delta per change in
+    'delta_vintage'/'delta_date'/'delta_value'. A delta means "from this
+    vintage on, this date has this value". A None value means the date has
+    no value from that vintage on (FRED '.' or an observation that was
+    withdrawn). Deltas are sorted by (vintage, date).
+    """
+    changes = {}
+    for obs_date, value, realtime_start, realtime_end in rows:
+        changes[(realtime_start, obs_date)] = value
+    # An observation whose validity ends without a successor was withdrawn
+    starts = {(obs_date, realtime_start) for obs_date, _, realtime_start, _ in rows}
+    for obs_date, _, _, realtime_end in rows:
+        if realtime_end == REALTIME_END:
+            continue
+        next_vintage = (date.fromisoformat(realtime_end) + timedelta(days=1)).isoformat()
+        if (obs_date, next_vintage) not in starts:
+            changes.setdefault((next_vintage, obs_date), None)
+
+    vintages = sorted({vintage for vintage, _ in changes})
+    dates = sorted({obs_date for _, obs_date in changes})
+    vintage_pos = {v: i for i, v in enumerate(vintages)}
+    date_pos = {d: i for i, d in enumerate(dates)}
+
+    # Drop deltas that repeat the value already current for that date
+    delta_vintage, delta_date, delta_value = [], [], []
+    current = {}
+    for vintage, obs_date in sorted(changes):
+        value = changes[(vintage, obs_date)]
+        if obs_date in current and current[obs_date] == value:
+            continue
+        current[obs_date] = value
+        delta_vintage.append(vintage_pos[vintage])
+        delta_date.append(date_pos[obs_date])
+        delta_value.append(value)
+
+    return {
+        'FRED_ID': fred_id,
+        'vintages': vintages,
+        'dates': dates,
+        'delta_vintage': delta_vintage,
+        'delta_date': delta_date,
+        'delta_value': delta_value,
+    }
+
+
+class VintageHistory:
+    """
+    Revision history of one series held as NumPy delta columns, with
+    as_of() reconstruction of what was known on a given date.
+    """
+
+    def __init__(self, history):
+        self.fred_id = history['FRED_ID']
+        self.vintages = history['vintages']
+        self.dates = np.array(history['dates'])
+        self.delta_vintage = np.array(history['delta_vintage'], dtype=np.int32)
+        self.delta_date = np.array(history['delta_date'], dtype=np.int32)
+        self.delta_value = np.array([np.nan if v is None else v for v in history['delta_value']], dtype=np.float64)
+
+    @classmethod
+    def load(cls, fred_id, vintages_dir=VINTAGES_DIR):
+        with open(vintage_path(fred_id, vintages_dir), 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def as_of(self, as_of_date):
+        """
+        Returns (dates, values) as they were published on as_of_date.
+        Deltas are sorted by vintage, so the deltas known then are a prefix;
+        the last delta per date in that prefix is its value.
+        """
+        known = bisect_right(self.vintages, as_of_date)
+        if known == 0:
+            return self.dates[:0], self.delta_value[:0]
+        n = int(np.searchsorted(self.delta_vintage, known, side='left'))
+
+        # First occurrence in the reversed prefix = latest delta for each date
+        latest_dates, reversed_pos = np.unique(self.delta_date[:n][::-1], return_index=True)
+        values = self.delta_value[:n][::-1][reversed_pos]
+        has_value = ~np.isnan(values)
+        return self.dates[latest_dates[has_value]], values[has_value]
+
+
+# --- Storage ---
+
+def vintage_path(fred_id, vintages_dir=VINTAGES_DIR):
+    return os.path.join(vintages_dir, f'{fred_id}.json')
+
+def update_vintage_history(fred_id, vintages_dir=VINTAGES_DIR):
+    """
+    Downloads a series' full ALFRED history and stores it delta-encoded.
+    Returns the number of deltas stored.
+    """
+    history = encode_revision_deltas(fred_id, fetch_realtime_observations(fred_id))
+    os.makedirs(vintages_dir, exist_ok=True)
+    path = vintage_path(fred_id, vintages_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return len(history['delta_value'])
+
+def fetch_last_updated(fred_id):
+    """Date ('YYYY-MM-DD') the series was last revised on FRED, from its metadata."""
+    params = {'series_id': fred_id, 'api_key': FRED_API_KEY, 'file_type': 'json'}
+    seriess = fred_api_get(f"{FRED_API_BASE_URL}/series", params, timeout=60).get('seriess') or []
+    if not seriess:
+        raise ValueError(f"No metadata for {fred_id}")
+    # e.g. '2024-05-01 07:51:03-05'
+    return seriess[0]['last_updated'][:10]
+
+def stored_latest_vintage(fred_id, vintages_dir=VINTAGES_DIR):
+    """The newest vintage (realtime_start) in a stored history, or None if none is stored."""
+    try:
+        with open(vintage_path(fred_id, vintages_dir), 'r', encoding='utf-8') as f:
+            vintages = json.load(f)['vintages']
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+    return vintages[-1] if vintages else None
+
+def refresh_vintage_history(fred_id, vintages_dir=VINTAGES_DIR, force=False):
+    """
+    Downloads a series' history again if it was never stored or FRED has
+    revised the series since the newest stored vintage (its last_updated
+    date is later). The check costs one small metadata request, so
+    revisions to past dates are picked up even when the latest
+    observations did not change. Returns the number of deltas stored, or
+    None if the stored history was current.
+    """
+    latest = None if force else stored_latest_vintage(fred_id, vintages_dir)
+    if latest is not None:
+        if fetch_last_updated(fred_id) <= latest:
+            return None
+        time.sleep(SERIES_QUERY_DELAY)
+    return update_vintage_history(fred_id, vintages_dir)
+
+def as_of(fred_id, as_of_date, vintages_dir=VINTAGES_DIR):
+    """(dates, values) of a stored series as known on as_of_date ('YYYY-MM-DD')."""
+    return VintageHistory.load(fred_id, vintages_dir).as_of(as_of_date)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruct a stored series as known on a past date.")
+    parser.add_argument('fred_id')
+    parser.add_argument('as_of_date', help="YYYY-MM-DD")
+    args = parser.parse_args(argv)
+    dates, values = as_of(args.fred_id, args.as_of_date)
+    for obs_date, value in zip(dates.tolist(), values.tolist()):
+        print(f"{obs_date}\t{value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
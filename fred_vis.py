@@ -1,35 +1,49 @@
 import plotly.express as px
 import pandas as pd
 import json
+import os
+import sys
 from urllib.request import urlopen
 import numpy as np
 
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GEOJSON_URL = 'https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json'
+
+# Define the path to your data file
+DATA_FILE_PATH = os.path.join(BASE_DIR, 'subs', 'fred_fips_map.json')
+FIPS_KEY = 'FIPS' # Key for FIPS code in the JSON file
+VALUE_KEY = 'County_Category_ID' # Key for the value to plot in the JSON file
+
 # --- 1. Load GeoJSON Data for US Counties ---
-# This GeoJSON file contains the county boundaries and the 'id' field is the 5-digit FIPS code.
-try:
-    with urlopen('https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json') as response:
+def load_county_geojson(cache_file=None):
+    """
+    Loads the county boundaries GeoJSON. The 'id' field of each feature is
+    the 5-digit FIPS code. With cache_file, the download is saved there and
+    reused on later calls.
+    """
+    if cache_file and os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    with urlopen(GEOJSON_URL) as response:
         counties = json.load(response)
-except Exception as e:
-    print(f"Error loading GeoJSON data: {e}")
-    # Exit or handle error if the critical GeoJSON data can't be fetched
-    exit()
 
-# --- 2. Prepare Sample Data (Your Data Here) ---
-# For demonstration, we create a dummy DataFrame with FIPS codes and a value.
-# **In a real scenario, you would load your own data here.**
-# The FIPS codes MUST be 5-digit strings (e.g., '01001' for Autauga County, AL).
-
-# Get all FIPS codes from the GeoJSON features for a complete map
-all_fips = [feature['id'] for feature in counties['features']]
+    if cache_file:
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump(counties, f)
+    return counties
 
 # --- 2. Prepare Your Custom Data ---
+def load_county_values(counties, data_file_path=DATA_FILE_PATH, fips_key=FIPS_KEY, value_key=VALUE_KEY):
+    """
+    Loads (FIPS, value) pairs from a JSON records file and left-joins them
+    onto every county in the GeoJSON, so counties without data are still
+    drawn (as NaN, usually shown in gray).
+    """
+    # Get all FIPS codes from the GeoJSON features for a complete map
+    all_fips = [feature['id'] for feature in counties['features']]
 
-# Define the path to your data file
-data_file_path = '/workspaces/US-County_analyses/subs/fred_fips_map.json'
-fips_key = 'FIPS' # Key for FIPS code in the JSON file
-value_key = 'County_Category_ID' # Key for the value to plot in the JSON file
-
-try:
     # Load your JSON file into a Pandas DataFrame
     custom_data = pd.read_json(data_file_path)
 
@@ -44,53 +58,93 @@ try:
     df_data['FIPS'] = df_data['FIPS'].astype(str).str.zfill(5)
 
     # 3. Create the final DataFrame (df) by merging your data with all FIPS codes.
-    # This ensures that even counties not in your JSON file are present, 
+    # This ensures that even counties not in your JSON file are present,
     # typically assigned a NaN/None value, which Plotly can handle (usually showing as gray).
     all_fips_df = pd.DataFrame({'FIPS': all_fips}) # all_fips comes from the GeoJSON loading step
-    
+
     df = all_fips_df.merge(df_data, on='FIPS', how='left')
 
-    # Optional: Fill missing values with a placeholder (e.g., 0 or a large number) 
+    # Optional: Fill missing values with a placeholder (e.g., 0 or a large number)
     # if you want unrepresented counties to have a specific color.
-    # df['Data_Value'] = df['Data_Value'].fillna(0) 
-
-except FileNotFoundError:
-    print(f"Error: The file {data_file_path} was not found.")
-    # Exit or provide a fallback mechanism if the data file is critical
-    exit()
-except Exception as e:
-    print(f"An error occurred while processing the JSON file: {e}")
-    exit()
-
-# The DataFrame 'df' is now ready for the Plotly creation step.
-# It has two columns: 'FIPS' (5-digit string) and 'Data_Value' (the County_Category_ID).
-
-# Ensure FIPS column is a string type
-df['FIPS'] = df['FIPS'].astype(str)
+    # df['Data_Value'] = df['Data_Value'].fillna(0)
+
+    # Ensure FIPS column is a string type
+    df['FIPS'] = df['FIPS'].astype(str)
+    return df
+
+def county_values_frame(values_by_fips, counties):
+    """
+    Same shape as load_county_values(), but from an in-memory {FIPS: value}
+    mapping such as a fred_regional.py cross-section.
+    """
+    all_fips = [feature['id'] for feature in counties['features']]
+    return pd.DataFrame({
+        'FIPS': all_fips,
+        'Data_Value': [values_by_fips.get(fips, np.nan) for fips in all_fips],
+    })
 
 # --- 3. Create the Choropleth Map ---
-fig = px.choropleth(
-    df,                               # Your DataFrame
-    geojson=counties,                 # The GeoJSON data for boundaries
-    locations='FIPS',                 # Column in your data that matches the GeoJSON 'id'
-    color='Data_Value',               # Column to use for coloring the counties
-    color_continuous_scale="Viridis", # Color scheme for the map
-    scope="usa",                      # Focus the map on the USA (essential for county maps)
-    labels={'Data_Value':'County Data Value'}, # Label for the color bar
-    hover_name='FIPS',                # Display the FIPS code on hover
-    title="US County Map by FIPS Code (Choropleth Example)"
-)
-
-# --- 4. Customize and Display the Map ---
-# Update layout to remove margins and make the map clean
-fig.update_layout(
-    margin={"r":0,"t":40,"l":0,"b":0},
-    mapbox_style="carto-positron" # You can choose a different background map style
-)
-
-# Remove county borders for a cleaner look if desired
-fig.update_traces(marker_line_width=0)
-
-# Display the interactive map
-# In Codespaces, this will open the map in your browser or an output tab.
-fig.show()
\ No newline at end of file
+def build_choropleth(df, counties, title="US County Map by FIPS Code (Choropleth Example)", label='County Data Value'):
+    """
+    Builds the county choropleth for a DataFrame with 'FIPS' (5-digit
+    string) and 'Data_Value' columns.
+    """
+    fig = px.choropleth(
+        df,                               # Your DataFrame
+        geojson=counties,                 # The GeoJSON data for boundaries
+        locations='FIPS',                 # Column in your data that matches the GeoJSON 'id'
+        color='Data_Value',               # Column to use for coloring the counties
+        color_continuous_scale="Viridis", # Color scheme for the map
+        scope="usa",                      # Focus the map on the USA (essential for county maps)
+        labels={'Data_Value': label},     # Label for the color bar
+        hover_name='FIPS',                # Display the FIPS code on hover
+        title=title
+    )
+
+    # --- 4. Customize and Display the Map ---
+    # Update layout to remove margins and make the map clean
+    fig.update_layout(
+        margin={"r":0,"t":40,"l":0,"b":0},
+        mapbox_style="carto-positron" # You can choose a different background map style
+    )
+
+    # Remove county borders for a cleaner look if desired
+    fig.update_traces(marker_line_width=0)
+    return fig
+
+def main(output_html=None):
+    """
+    Draws the county map. Displays it interactively, or writes it to
+    output_html when a path is given (used by fred_pipeline.py).
+    """
+    try:
+        counties = load_county_geojson()
+    except Exception as e:
+        print(f"Error loading GeoJSON data: {e}")
+        # Exit or handle error if the critical GeoJSON data can't be fetched
+        sys.exit(1)
+
+    try:
+        df = load_county_values(counties)
+    except FileNotFoundError:
+        print(f"Error: The file {DATA_FILE_PATH} was not found.")
+        # Exit or provide a fallback mechanism if the data file is critical
+        sys.exit(1)
+    except Exception as e:
+        print(f"An error occurred while processing the JSON file: {e}")
+        sys.exit(1)
+
+    # The DataFrame 'df' is now ready for the Plotly creation step.
+    # It has two columns: 'FIPS' (5-digit string) and 'Data_Value' (the County_Category_ID).
+    fig = build_choropleth(df, counties)
+
+    if output_html:
+        fig.write_html(output_html)
+        print(f"Map saved to: {output_html}")
+    else:
+        # Display the interactive map
+        # In Codespaces, this will open the map in your browser or an output tab.
+        fig.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Renders a county map for every series title in fred_by_series_title.json.
+
+Titles whose series are stored by fred_observations.py are drawn from the
+latest stored value of each county. Every other title is drawn from its
+latest GeoFRED cross-section (fred_regional.py): two API requests per map,
+made from this process and spaced MAP_FETCH_INTERVAL apart so the worker
+processes never compete for the FRED rate limit. Pass --stored-only to
+render just the titles with stored observations, without any requests.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fred_observations import OBSERVATIONS_DIR, load_series_observations
+
+# --- Configuration ---
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TITLES_FILE = os.path.join(BASE_DIR, 'fred_by_series_title.json')
+MAPS_DIR = os.path.join(BASE_DIR, 'fred_maps')
+MANIFEST_FILE = os.path.join(MAPS_DIR, 'manifest.json')
+GEOJSON_CACHE_FILE = os.path.join(MAPS_DIR, 'geojson-counties-fips.json')
+
+# Bump when the look of the maps changes so every map is re-rendered
+RENDER_VERSION = 1
+# Seconds between GeoFRED cross-section fetches (two API requests each);
+# FRED allows 120 requests a minute
+MAP_FETCH_INTERVAL = 1.2
+# PNG size for the offline (kaleido) image export
+PNG_WIDTH = 1400
+PNG_HEIGHT = 900
+
+# Per-process state set up once by _init_worker()
+_worker = {}
+
+
+def map_slug(title):
+    slug = re.sub(r'[^a-z0-9]+', '_', title.lower()).strip('_')[:80]
+    return f"{slug}_{hashlib.sha1(title.encode('utf-8')).hexdigest()[:8]}"
+
+def latest_values(fred_ids_by_fips, observations_dir=OBSERVATIONS_DIR):
+    """
+    Returns {FIPS: (date, value)} with the latest non-missing observation
+    of each county's series, for the counties whose observations are stored.
+    """
+    values = {}
+    for fips, fred_id in fred_ids_by_fips.items():
+        series = load_series_observations(fred_id, observations_dir)
+        if not series:
+            continue
+        for obs_date, value in zip(reversed(series['dates']), reversed(series['values'])):
+            if value is not None:
+                values[fips] = (obs_date, value)
+                break
+    return values
+
+def data_hash(title, values, fmt):
+    payload = json.dumps([RENDER_VERSION, title, fmt, sorted(values.items())], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# --- Workers ---
+
+def _init_worker(geojson_file):
+    """Loads plotly, the county geometry and the county list once per worker process."""
+    import fred_vis
+
+    _worker['fred_vis'] = fred_vis
+    _worker['counties'] = fred_vis.load_county_geojson(geojson_file)
+
+def render_map(title, fred_ids_by_fips, units, fmt, output_path, previous_hash, observations_dir, values=None):
+    """
+    Renders one series family's latest county values to output_path unless
+    the data hash matches previous_hash and the file exists. The values
+    ({FIPS: (date, value)}) are read from the stored observations unless
+    given. Returns (title, status, hash).
+    """
+    if values is None:
+        values = latest_values(fred_ids_by_fips, observations_dir)
+    if not values:
+        return title, 'no data', previous_hash
+
+    digest = data_hash(title, values, fmt)
+    if digest == previous_hash and os.path.exists(output_path):
+        return title, 'unchanged', digest
+
+    fred_vis = _worker['fred_vis']
+    counties = _worker['counties']
+    dates = sorted(obs_date for obs_date, _ in values.values())
+    period = dates[0] if dates[0] == dates[-1] else f"{dates[0]} .. {dates[-1]}"
+    df = fred_vis.county_values_frame({fips: value for fips, (_, value) in values.items()}, counties)
+    fig = fred_vis.build_choropleth(df, counties, title=f"{title} ({period})", label=units or 'Value')
+
+    tmp_path = output_path + '.tmp'
+    if fmt == 'png':
+        fig.write_image(tmp_path, format='png', width=PNG_WIDTH, height=PNG_HEIGHT, engine='kaleido')
+    else:
+        fig.write_html(tmp_path, include_plotlyjs='cdn')
+    os.replace(tmp_path, output_path)
+    return title, 'rendered', digest
+
+
+# --- Batch ---
+
+def stored_series_ids(observations_dir=OBSERVATIONS_DIR):
+    """Returns the set of FRED_IDs with stored observations."""
+    try:
+        names = os.listdir(observations_dir)
+    except FileNotFoundError:
+        return set()
+    return {name[:-len('.json')] for name in names if name.endswith('.json')}
+
+def fetch_latest_values(fred_ids_by_fips):
+    """
+    Returns {FIPS: (date, value)} from the latest GeoFRED cross-section of
+    a family, limited to its counties. Returns {} if the family has no
+    regional series group.
+    """
+    from fred_regional import cross_section_for_series
+
+    try:
+        meta, values = cross_section_for_series(next(iter(fred_ids_by_fips.values())))
+    except ValueError:
+        return {}
+    obs_date = meta['date']
+    return {fips: (obs_date, value) for fips, value in values.items() if fips in fred_ids_by_fips}
+
+def load_map_jobs(titles_file=TITLES_FILE):
+    """
+    Returns [(title, {FIPS: FRED_ID}, units)] for every normalized series
+    title in fred_by_series_title.json.
+    """
+    with open(titles_file, 'r', encoding='utf-8') as f:
+        by_title = json.load(f)
+
+    jobs = []
+    for title, records in by_title.items():
+        fred_ids_by_fips = {}
+        units = None
+        for record in records:
+            if record.get('FIPS') and record.get('FRED_ID'):
+                fred_ids_by_fips.setdefault(record['FIPS'], record['FRED_ID'])
+                units = units or record.get('Units')
+        if fred_ids_by_fips:
+            jobs.append((title, fred_ids_by_fips, units))
+    return jobs
+
+def render_all_maps(fmt='html', workers=None, titles=None, titles_file=TITLES_FILE,
+                    maps_dir=MAPS_DIR, observations_dir=OBSERVATIONS_DIR, stored_only=False):
+    """
+    Renders a map for every series title (or just `titles`) across a process
+    pool. Maps whose input data hash is unchanged since the last run are
+    skipped. The hashes are kept in fred_maps/manifest.json.
+
+    Titles without stored observations are drawn from GeoFRED
+    cross-sections unless stored_only is True. Raises RuntimeError if any
+    map failed, after saving the hashes of the ones that succeeded.
+    """
+    if fmt not in ('html', 'png'):
+        raise ValueError("fmt must be 'html' or 'png'")
+    os.makedirs(maps_dir, exist_ok=True)
+    manifest_file = os.path.join(maps_dir, 'manifest.json')
+    geojson_file = os.path.join(maps_dir, os.path.basename(GEOJSON_CACHE_FILE))
+
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+
+    jobs = load_map_jobs(titles_file)
+    if titles:
+        wanted = set(titles)
+        jobs = [job for job in jobs if job[0] in wanted]
+    print(f"Rendering {len(jobs)} {fmt.upper()} maps into {maps_dir}...")
+
+    # Download the geometry once here so the workers only read the cache
+    if not os.path.exists(geojson_file):
+        import fred_vis
+        fred_vis.load_county_geojson(geojson_file)
+
+    stored = stored_series_ids(observations_dir)
+    local_jobs = [job for job in jobs if not stored.isdisjoint(job[1].values())]
+    remote_jobs = [] if stored_only else [job for job in jobs if stored.isdisjoint(job[1].values())]
+    if remote_jobs:
+        print(f"  {len(local_jobs)} from stored observations, {len(remote_jobs)} from GeoFRED cross-sections")
+
+    started = time.perf_counter()
+    counts = {'rendered': 0, 'unchanged': 0, 'no data': len(jobs) - len(local_jobs) - len(remote_jobs), 'failed': 0}
+
+    # Workers are started from this module's own import name so that spawn
+    # and forkserver children can unpickle render_map and _init_worker
+    import fred_vis_batch as batch
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=batch._init_worker, initargs=(geojson_file,)) as pool:
+        futures = {}
+
+        def submit(title, fred_ids_by_fips, units, values=None):
+            key = f"{map_slug(title)}.{fmt}"
+            future = pool.submit(batch.render_map, title, fred_ids_by_fips, units, fmt,
+                                 os.path.join(maps_dir, key), manifest.get(key), observations_dir, values)
+            futures[future] = key
+
+        for title, fred_ids_by_fips, units in local_jobs:
+            submit(title, fred_ids_by_fips, units)
+
+        # Local maps render in the pool while the cross-sections download
+        if remote_jobs:
+            import requests
+            from fred_scheduler import RateLimiter
+
+            limiter = RateLimiter(MAP_FETCH_INTERVAL)
+            for title, fred_ids_by_fips, units in remote_jobs:
+                limiter.wait()
+                try:
+                    values = fetch_latest_values(fred_ids_by_fips)
+                except (requests.RequestException, KeyError) as e:
+                    counts['failed'] += 1
+                    print(f"  ! {title}: error fetching its cross-section: {e}")
+                    continue
+                if not values:
+                    counts['no data'] += 1
+                    continue
+                submit(title, fred_ids_by_fips, units, values)
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            key = futures[future]
+            try:
+                title, status, digest = future.result()
+            except Exception as e:
+                counts['failed'] += 1
+                print(f"  [{done}/{len(futures)}] ! {key}: {e}")
+                continue
+            counts[status] += 1
+            if digest:
+                manifest[key] = digest
+            if status == 'rendered':
+                print(f"  [{done}/{len(futures)}] ✓ {title}")
+
+    tmp_path = manifest_file + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, manifest_file)
+
+    print(f"\nDone in {time.perf_counter() - started:.1f}s: {counts['rendered']} rendered, "
+          f"{counts['unchanged']} unchanged, {counts['no data']} without data, {counts['failed']} failed.")
+    if counts['failed']:
+        raise RuntimeError(f"{counts['failed']} of {len(jobs)} maps failed")
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a county map for every series title in parallel.")
+    parser.add_argument('--format', choices=['html', 'png'], default='html',
+                        help="png uses plotly's offline exporter (requires kaleido)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--title', action='append', dest='titles', help="only render this title (repeatable)")
+    parser.add_argument('--stored-only', action='store_true',
+                        help="only render titles with stored observations (no GeoFRED requests)")
+    args = parser.parse_args(argv)
+    try:
+        render_all_maps(args.format, args.workers, args.titles, stored_only=args.stored_only)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
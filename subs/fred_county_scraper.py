@@ -1,9 +1,11 @@
 # script1_scrape_fred_county_list.py
 
+import os
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 import re
+import sys
 import time
 import json # Import json for final output
 
@@ -11,7 +13,8 @@ import json # Import json for final output
 # The starting URL for U.S. Regional Data, which links to all states.
 TOP_LEVEL_REGIONAL_URL = "https://fred.stlouisfed.org/categories/27281"
 FRED_BASE_URL = "https://fred.stlouisfed.org"
-OUTPUT_JSON_FILE = "fred_county_ids.json" # New output file name
+SUBS_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_JSON_FILE = os.path.join(SUBS_DIR, "fred_county_ids.json") # New output file name
 
 # --- Helper Functions ---
 
@@ -120,10 +123,11 @@ def get_all_state_county_pages():
 
     return state_county_urls
 
-# --- Main Execution ---
-
-if __name__ == "__main__":
-    
+def scrape_fred_county_ids(output_json_file=OUTPUT_JSON_FILE):
+    """
+    Crawls every state's county page on FRED and saves the combined
+    county category list to output_json_file.
+    """
     all_county_series_data = []
     
     # Step 1: Get the specific 'Counties' page URL for every state
@@ -141,7 +145,16 @@ if __name__ == "__main__":
     # Final Output
     if not df.empty:
         # Use to_json() with orient='records' for a list of objects and indent=4 for readability
-        df.to_json(OUTPUT_JSON_FILE, orient='records', indent=4) 
-        print(f"\n✅ SUCCESS: Scraped and saved {len(df)} county entries to {OUTPUT_JSON_FILE}")
+        df.to_json(output_json_file, orient='records', indent=4) 
+        print(f"\n✅ SUCCESS: Scraped and saved {len(df)} county entries to {output_json_file}")
     else:
-        print("\n❌ FAILURE: Failed to retrieve any county data.")
\ No newline at end of file
+        raise RuntimeError("❌ FAILURE: Failed to retrieve any county data.")
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    try:
+        scrape_fred_county_ids()
+    except RuntimeError as e:
+        print(f"{e}")
+        sys.exit(1)
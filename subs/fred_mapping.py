@@ -1,17 +1,25 @@
 import pandas as pd
 import json
+import os
 import re
+import sys
 from io import StringIO # Used for placeholder data when files are not found
 
+SUBS_DIR = os.path.dirname(os.path.abspath(__file__))
+# fred_crosswalk.py lives in the repository root
+sys.path.insert(0, os.path.dirname(SUBS_DIR))
+
+from fred_crosswalk import bea_area_fips
+
 # Define the file paths (INPUT files are now JSON)
-FIPS_FILE_PATH = "/workspaces/US-County_analyses/subs/county_fips.json"
-FRED_FILE_PATH = "/workspaces/US-County_analyses/subs/fred_county_ids.json"
-MAP_FILE_PATH = "/workspaces/US-County_analyses/fred_name_correction_map.json"
+FIPS_FILE_PATH = os.path.join(SUBS_DIR, "county_fips.json")
+FRED_FILE_PATH = os.path.join(SUBS_DIR, "fred_county_ids.json")
+MAP_FILE_PATH = os.path.join(SUBS_DIR, "fred_name_correction_map.json")
 
 # Define the output file names (output files are JSON)
-MAP_OUTPUT_FILE = "fred_fips_map.json"
-FIPS_NO_MATCH_OUTPUT_FILE = "fips_no_match.json"
-FRED_NO_MATCH_OUTPUT_FILE = "fred_no_match.json"
+MAP_OUTPUT_FILE = os.path.join(SUBS_DIR, "fred_fips_map.json")
+FIPS_NO_MATCH_OUTPUT_FILE = os.path.join(SUBS_DIR, "fips_no_match.json")
+FRED_NO_MATCH_OUTPUT_FILE = os.path.join(SUBS_DIR, "fred_no_match.json")
 
 # Placeholder JSON content for the name correction map
 name_correction_json = """
@@ -102,11 +110,9 @@ def generate_county_maps_with_correction():
         print("Name correction map loaded successfully.")
         
     except FileNotFoundError as e:
-        print(f"🛑 Error: One or more files could not be found. Please check paths. {e}")
-        return
+        raise RuntimeError(f"🛑 Error: One or more files could not be found. Please check paths. {e}") from e
     except Exception as e:
-        print(f"🛑 Critical Error during file loading. Is the JSON format correct? Details: {e}")
-        return
+        raise RuntimeError(f"🛑 Critical Error during file loading. Is the JSON format correct? Details: {e}") from e
 
 
     # --- 2. Data Preparation: Clean and Correct FRED County Names ---
@@ -141,6 +147,21 @@ def generate_county_maps_with_correction():
         indicator='_merge'
     )
     
+    # --- 3b. BEA combined areas ---
+    # FRED lists some BEA areas (e.g. 'Albemarle County + Charlottesville
+    # City, VA') that match no single county. Give them their BEA code
+    # (51901 etc., see fred_crosswalk.BEA_AREAS) so they are fetched with
+    # the counties instead of ending up in fred_no_match.json.
+    bea_codes = df_full_join['County_Name'].map(lambda name: bea_area_fips(name) if isinstance(name, str) else None)
+    is_bea = (df_full_join['_merge'] == 'right_only') & bea_codes.notna()
+    state_of_prefix = dict(zip(df_fips['FIPS'].str[:2], df_fips['State']))
+    df_full_join.loc[is_bea, 'FIPS'] = bea_codes[is_bea]
+    df_full_join.loc[is_bea, 'CountyName'] = df_full_join.loc[is_bea, 'County_Name'].str.replace(
+        r',\s*[A-Z]{2}\b', '', regex=True).str.strip()
+    df_full_join.loc[is_bea, 'State'] = bea_codes[is_bea].str[:2].map(state_of_prefix)
+    df_full_join.loc[is_bea, '_merge'] = 'both'
+    print(f"Matched {int(is_bea.sum())} FRED BEA combined areas to their BEA codes.")
+
     # --- 4. Generate Output JSON Files (NO CHANGES NEEDED HERE) ---
     
     # Define common JSON output arguments
@@ -184,4 +205,8 @@ def generate_county_maps_with_correction():
     print("\n--- Process Complete ---")
 
 if __name__ == "__main__":
-    generate_county_maps_with_correction()
\ No newline at end of file
+    try:
+        generate_county_maps_with_correction()
+    except RuntimeError as e:
+        print(f"{e}")
+        sys.exit(1)
\ No newline at end of file
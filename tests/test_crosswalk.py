@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fred_crosswalk
+from fred_crosswalk import Crosswalk
+
+
+@pytest.fixture
+def fips_map_file(tmp_path):
+    """A small census2010 county axis: unchanged counties, a split, a merge and Connecticut."""
+    codes = {
+        '01001': 'AL', '01003': 'AL',
+        '02261': 'AK',
+        '09001': 'CT', '09003': 'CT', '09005': 'CT', '09007': 'CT',
+        '09009': 'CT', '09011': 'CT', '09013': 'CT', '09015': 'CT',
+        '51003': 'VA', '51540': 'VA',
+    }
+    path = tmp_path / 'fred_fips_map.json'
+    path.write_text(json.dumps([{'FIPS': code, 'State': state} for code, state in codes.items()]))
+    return str(path)
+
+@pytest.fixture(autouse=True)
+def no_relationship_files(monkeypatch):
+    monkeypatch.setattr(fred_crosswalk, 'RELATIONSHIP_FILES', {})
+
+
+def test_mean_round_trip_keeps_one_to_one_counties_with_missing_weight(fips_map_file):
+    walk = Crosswalk.build('census2022', fips_map_file)
+    values = np.arange(1.0, len(walk.base_fips) + 1)
+    weights = np.full(len(walk.base_fips), 1000.0)
+    weights[walk.base_fips.index('01003')] = np.nan
+
+    forward = walk.remap(values, 'mean', weights)
+    back = walk.remap(forward, 'mean', weights, reverse=True)
+
+    for code in ('01001', '01003', '02261'):
+        row = walk.base_fips.index(code)
+        assert back[row] == pytest.approx(values[row])
+
+def test_mean_falls_back_to_shares_when_a_merged_weight_is_missing(fips_map_file):
+    walk = Crosswalk.build('bea', fips_map_file)
+    values = np.zeros(len(walk.base_fips))
+    values[walk.base_fips.index('51003')] = 2.0
+    values[walk.base_fips.index('51540')] = 4.0
+    weights = np.full(len(walk.base_fips), np.nan)
+    weights[walk.base_fips.index('51003')] = 100.0
+
+    result = walk.remap(values, 'mean', weights)
+
+    assert result[walk.fips.index('51901')] == pytest.approx(3.0)
+
+def test_connecticut_counties_map_onto_planning_regions(fips_map_file):
+    walk = Crosswalk.build('census2022', fips_map_file)
+    assert not walk.unmapped()
+    assert not [code for code in walk.fips if code.startswith('09') and code < '09100']
+
+    counts = np.ones(len(walk.base_fips))
+    regions = walk.remap(counts, 'sum')
+    connecticut = [i for i, code in enumerate(walk.fips) if code.startswith('09')]
+    assert len(connecticut) == 9
+    assert regions[connecticut].sum() == pytest.approx(8.0, abs=1e-3)
@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fred_records import SeriesRecordTable, StringPool, write_tables_json
+
+
+def record(fips, county, fred_id, units, title):
+    return {'FIPS': fips, 'County_Name': county, 'FRED_ID': fred_id, 'Units': units, 'Full_Series_Title': title}
+
+@pytest.fixture
+def grouped():
+    """A state's {title: [record, ...]} with an empty group, a non-ASCII county and titles without a location."""
+    return {
+        'Unemployment Rate': [
+            record('35013', 'Doña Ana County, NM', 'NMDONA5URN', 'Percent', 'Unemployment Rate in Doña Ana County, NM'),
+            record('35001', 'Bernalillo County, NM', 'NMBERN1URN', 'Percent', 'Unemployment Rate in Bernalillo County, NM'),
+        ],
+        'Resident Population': [
+            record('35001', 'Bernalillo County, NM', 'NMBERN1POP', 'Thousands of Persons',
+                   'Resident Population in Bernalillo County, NM'),
+        ],
+        'Estimate of Median Household Income': [
+            record('35001', 'Bernalillo County, NM', 'MHINM35001A052NCEN', None,
+                   'Estimate of Median Household Income for Bernalillo County, NM'),
+            record('35001', 'Bernalillo County, NM', 'B080ACS035001', 'Percent', 'Burdened Households'),
+        ],
+        'Discontinued Series': [],
+    }
+
+def dumped(write, *args, **kwargs):
+    f = io.StringIO()
+    write(*args, f, **kwargs)
+    return f.getvalue()
+
+
+@pytest.mark.parametrize('indent', [2, 4])
+@pytest.mark.parametrize('sort_keys', [False, True])
+def test_write_json_matches_json_dumps(grouped, indent, sort_keys):
+    table = SeriesRecordTable.from_grouped(grouped)
+
+    assert table.to_dict() == grouped
+    assert dumped(table.write_json, indent=indent, sort_keys=sort_keys) == \
+        json.dumps(grouped, indent=indent, sort_keys=sort_keys)
+
+def test_write_json_of_empty_table_matches_json_dumps():
+    assert dumped(SeriesRecordTable().write_json) == json.dumps({}, indent=4)
+    assert dumped(SeriesRecordTable.from_grouped({'Empty': []}).write_json) == json.dumps({'Empty': []}, indent=4)
+
+@pytest.mark.parametrize('sort_keys', [False, True])
+def test_write_tables_json_matches_json_dumps(grouped, sort_keys):
+    pool = StringPool()
+    master = {
+        'NM': grouped,
+        'DC': {'Unemployment Rate': [record('11001', 'District of Columbia', 'DCUR', 'Percent',
+                                            'Unemployment Rate in the District of Columbia')]},
+        'AK': {},
+    }
+    tables = {state: SeriesRecordTable.from_grouped(data, pool) for state, data in master.items()}
+
+    assert dumped(write_tables_json, tables, indent=4, sort_keys=sort_keys) == \
+        json.dumps(master, indent=4, sort_keys=sort_keys)
+    assert dumped(write_tables_json, {}, indent=4) == json.dumps({}, indent=4)
@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fred_observations import save_series_observations
+from fred_resample import align_family
+
+MONTHS_2020 = [f'2020-{m:02d}-01' for m in range(1, 13)]
+QUARTERS_2020 = ['2020-01-01', '2020-04-01', '2020-07-01', '2020-10-01']
+
+
+class FakeIndex:
+    """The two QueryIndex lookups align_family uses, over {FRED_ID: FIPS}."""
+
+    def __init__(self, counties):
+        self.series = {fred_id: (fips,) for fred_id, fips in counties.items()}
+
+    def series_for_title(self, family):
+        return list(self.series)
+
+@pytest.fixture
+def family(tmp_path):
+    """
+    One family stored at mixed frequencies:
+      01001 monthly 1..12 through 2020, June missing
+      01003 quarterly 10, 20, 30, 40 through 2020
+      02013 annual 100 (2019) and 200 (2020)
+      02016 annual 999 and monthly 5s for 2020 (the monthly series wins)
+    Returns the keyword arguments for align_family().
+    """
+    fips_map_file = tmp_path / 'fred_fips_map.json'
+    fips_map_file.write_text(json.dumps([
+        {'FIPS': '01001', 'State': 'AL'}, {'FIPS': '01003', 'State': 'AL'},
+        {'FIPS': '02013', 'State': 'AK'}, {'FIPS': '02016', 'State': 'AK'},
+    ]))
+    observations_dir = tmp_path / 'observations'
+    observations_dir.mkdir()
+    stored = {
+        'M01001': ('01001', 'M', MONTHS_2020, [1, 2, 3, 4, 5, None, 7, 8, 9, 10, 11, 12]),
+        'Q01003': ('01003', 'Q', QUARTERS_2020, [10, 20, 30, 40]),
+        'A02013': ('02013', 'A', ['2019-01-01', '2020-01-01'], [100, 200]),
+        'A02016': ('02016', 'A', ['2020-01-01'], [999]),
+        'M02016': ('02016', 'M', MONTHS_2020, [5] * 12),
+    }
+    for fred_id, (fips, frequency, dates, values) in stored.items():
+        save_series_observations({'FRED_ID': fred_id, 'FIPS': fips, 'frequency': frequency,
+                                  'dates': dates, 'values': values}, str(observations_dir))
+    return {
+        'index': FakeIndex({fred_id: fips for fred_id, (fips, *_) in stored.items()}),
+        'observations_dir': str(observations_dir),
+        'fips_map_file': str(fips_map_file),
+    }
+
+def rows_by_county(aligned):
+    """{fips: {period: value}} of the periods that have a value."""
+    return {code: {period: aligned.values[i, j] for j, period in enumerate(aligned.periods) if aligned.mask[i, j]}
+            for i, code in enumerate(aligned.fips)}
+
+
+def test_quarterly_mean_averages_months_and_repeats_years(family):
+    aligned = align_family('Test', 'Q', 'mean', **family)
+    rows = rows_by_county(aligned)
+
+    assert aligned.periods[0] == '2019-01-01' and aligned.periods[-1] == '2020-10-01'
+    assert list(rows['01001'].values()) == pytest.approx([2.0, 4.5, 8.0, 11.0])
+    assert list(rows['01003'].values()) == pytest.approx([10, 20, 30, 40])
+    assert list(rows['02013'].values()) == pytest.approx([100] * 4 + [200] * 4)
+    assert list(rows['02016'].values()) == pytest.approx([5] * 4)
+
+def test_quarterly_end_takes_last_months_and_places_years_on_their_last_quarter(family):
+    rows = rows_by_county(align_family('Test', 'Q', 'end', **family))
+
+    assert rows['01001'] == pytest.approx({'2020-01-01': 3, '2020-04-01': 5, '2020-07-01': 9, '2020-10-01': 12})
+    assert rows['01003'] == pytest.approx(dict(zip(QUARTERS_2020, [10, 20, 30, 40])))
+    assert rows['02013'] == pytest.approx({'2019-10-01': 100, '2020-10-01': 200})
+
+def test_quarterly_sum_totals_months_and_splits_years(family):
+    rows = rows_by_county(align_family('Test', 'Q', 'sum', **family))
+
+    assert list(rows['01001'].values()) == pytest.approx([6, 9, 24, 33])
+    assert list(rows['02013'].values()) == pytest.approx([25] * 4 + [50] * 4)
+    assert list(rows['02016'].values()) == pytest.approx([15] * 4)
+
+def test_annual_target_prefers_the_finest_source(family):
+    rows = rows_by_county(align_family('Test', 'A', 'mean', **family))
+
+    assert rows['01001'] == pytest.approx({'2020-01-01': 72 / 11})
+    assert rows['01003'] == pytest.approx({'2020-01-01': 25})
+    assert rows['02013'] == pytest.approx({'2019-01-01': 100, '2020-01-01': 200})
+    assert rows['02016'] == pytest.approx({'2020-01-01': 5})
+
+def test_monthly_sum_splits_quarters_evenly(family):
+    aligned = align_family('Test', 'M', 'sum', **family)
+    row = aligned.fips.index('01003')
+
+    first = aligned.periods.index('2020-01-01')
+    assert aligned.values[row, first:first + 12] == pytest.approx(np.repeat([10, 20, 30, 40], 3) / 3)
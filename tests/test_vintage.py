@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fred_vintage
+from fred_vintage import REALTIME_END, VintageHistory, encode_revision_deltas
+
+
+@pytest.fixture
+def rows():
+    """
+    ALFRED realtime rows: January is first published as 1.0 and revised to
+    1.5, February is published and later withdrawn, and March is
+    published once.
+    """
+    return [
+        ('2020-01-01', 1.0, '2020-02-01', '2020-02-29'),
+        ('2020-01-01', 1.5, '2020-03-01', REALTIME_END),
+        ('2020-02-01', 2.0, '2020-03-01', '2020-05-31'),
+        ('2020-03-01', 3.0, '2020-04-01', REALTIME_END),
+    ]
+
+def as_of(history, as_of_date):
+    dates, values = history.as_of(as_of_date)
+    return dict(zip(dates.tolist(), values.tolist()))
+
+
+def test_as_of_before_the_first_vintage_is_empty(rows):
+    history = VintageHistory(encode_revision_deltas('TEST', rows))
+    assert as_of(history, '2020-01-31') == {}
+
+def test_as_of_before_and_after_a_revision(rows):
+    history = VintageHistory(encode_revision_deltas('TEST', rows))
+
+    assert as_of(history, '2020-02-01') == {'2020-01-01': 1.0}
+    assert as_of(history, '2020-02-29') == {'2020-01-01': 1.0}
+    assert as_of(history, '2020-03-01') == {'2020-01-01': 1.5, '2020-02-01': 2.0}
+
+def test_as_of_before_and_after_a_withdrawal(rows):
+    history = VintageHistory(encode_revision_deltas('TEST', rows))
+
+    assert as_of(history, '2020-05-31') == {'2020-01-01': 1.5, '2020-02-01': 2.0, '2020-03-01': 3.0}
+    assert as_of(history, '2020-06-01') == {'2020-01-01': 1.5, '2020-03-01': 3.0}
+    assert as_of(history, '2024-01-01') == {'2020-01-01': 1.5, '2020-03-01': 3.0}
+
+def test_stored_history_round_trips(rows, tmp_path, monkeypatch):
+    monkeypatch.setattr(fred_vintage, 'fetch_realtime_observations', lambda fred_id: rows)
+
+    assert fred_vintage.update_vintage_history('TEST', str(tmp_path)) == 5
+    assert fred_vintage.stored_latest_vintage('TEST', str(tmp_path)) == '2020-06-01'
+    dates, values = fred_vintage.as_of('TEST', '2020-03-15', str(tmp_path))
+    assert dates.tolist() == ['2020-01-01', '2020-02-01']
+    assert values.tolist() == [1.5, 2.0]